@@ -0,0 +1,92 @@
+import uuid
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.models import Grade
+
+# (dimension, ai column, teacher column)
+DIMENSIONS = (
+    ('task_completeness', 'ai_task_completeness', 'final_task_completeness'),
+    ('code_quality', 'ai_code_quality', 'final_code_quality'),
+    ('correctness', 'ai_correctness', 'final_correctness'),
+    ('total', 'ai_total', 'teacher_total'),
+)
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10
+VERSION_KEY = 'grade-analytics-version'
+CACHE_TIMEOUT = 60 * 60
+
+
+def _new_version():
+    # A fresh value rather than incr(): the file cache increments by read-then-write, which can lose a bump
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate():
+    # Called on every grade write; a new version orphans all cached results at once. After commit, so
+    # another worker cannot cache the pre-write grades under the new version.
+    transaction.on_commit(_new_version)
+
+
+def _distribution(values):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return {'count': 0}
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'percentiles': dict(zip(map(str, PERCENTILES), np.percentile(values, PERCENTILES).tolist())),
+        'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+    }
+
+
+def _agreement(ai, teacher):
+    paired = ~(np.isnan(ai) | np.isnan(teacher))
+    ai, teacher = ai[paired], teacher[paired]
+    if not ai.size:
+        return {'pairs': 0}
+    delta = ai - teacher
+    correlation = None
+    if ai.size > 1 and ai.std() and teacher.std():
+        correlation = float(np.corrcoef(ai, teacher)[0, 1])
+    return {
+        'pairs': int(ai.size),
+        'mean_absolute_delta': float(np.abs(delta).mean()),
+        'mean_delta': float(delta.mean()),
+        'correlation': correlation,
+    }
+
+
+def compute(grades):
+    columns = [column for _, ai, teacher in DIMENSIONS for column in (ai, teacher)]
+    # None becomes NaN, so missing scores drop out of every statistic
+    data = np.array(list(grades.values_list(*columns)), dtype=float).reshape(-1, len(columns))
+    result = {'grades': int(data.shape[0]), 'dimensions': {}}
+    for i, (name, _, _) in enumerate(DIMENSIONS):
+        ai, teacher = data[:, 2 * i], data[:, 2 * i + 1]
+        result['dimensions'][name] = {
+            'ai': _distribution(ai),
+            'teacher': _distribution(teacher),
+            'agreement': _agreement(ai, teacher),
+        }
+    return result
+
+
+def grade_analytics(scope, pk):
+    version = cache.get(VERSION_KEY, 0)
+    key = f'grade-analytics:{version}:{scope}:{pk}'
+    result = cache.get(key)
+    if result is None:
+        if scope == 'homework':
+            grades = Grade.objects.filter(submission__homework_id=pk)
+        else:
+            grades = Grade.objects.filter(submission__homework__group_id=pk)
+        result = compute(grades)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class AppsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps'
+
+    def ready(self):
+        from apps.lifecycle import enqueue_grading, recompute_standings
+        from apps.scheduler import homework_closed
+        from apps.search import create_search_indexes
+        from apps.tokens import check_shared_cache
+        post_migrate.connect(create_search_indexes, sender=self)
+        checks.register(check_shared_cache, checks.Tags.caches)
+        homework_closed.connect(enqueue_grading, dispatch_uid='apps.enqueue_grading')
+        homework_closed.connect(recompute_standings, dispatch_uid='apps.recompute_standings')
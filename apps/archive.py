@@ -0,0 +1,132 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.analytics import invalidate
+from apps.models import (ArchivedSubmission, Grade, Homework, Submission, SubmissionFile,
+                         SubmissionFileMetrics, SubmissionFileVersion)
+
+SUBMISSION_FIELDS = ('id', 'homework_id', 'student_id', 'submitted_at', 'ai_grade', 'final_grade',
+                     'ai_feedback', 'version', 'created_at')
+FILE_FIELDS = ('id', 'file_name', 'content', 'line_count')
+METRIC_FIELDS = ('line_count', 'non_blank_lines', 'comment_lines', 'function_count', 'class_count',
+                 'cyclomatic_complexity', 'parsed_ok', 'computed_at')
+HISTORY_FIELDS = ('file_name', 'version', 'kind', 'data', 'created_at')
+GRADE_FIELDS = tuple(f.attname for f in Grade._meta.concrete_fields if f.attname != 'submission_id')
+DATETIME_FIELDS = ('submitted_at', 'created_at', 'computed_at')
+
+
+def _fields(obj, names):
+    # isoformat keeps microseconds, which DjangoJSONEncoder would drop
+    return {name: value.isoformat() if isinstance(value, datetime) else value
+            for name, value in ((name, getattr(obj, name)) for name in names)}
+
+
+def pack(submission):
+    data = _fields(submission, SUBMISSION_FIELDS)
+    data['files'] = []
+    for file in submission.files.all():
+        item = _fields(file, FILE_FIELDS)
+        metrics = getattr(file, 'metrics', None)
+        item['metrics'] = _fields(metrics, METRIC_FIELDS) if metrics else None
+        data['files'].append(item)
+    data['history'] = [_fields(row, HISTORY_FIELDS) for row in submission.file_versions.all()]
+    grade = getattr(submission, 'grade', None)
+    data['grade'] = _fields(grade, GRADE_FIELDS) if grade else None
+    return zlib.compress(json.dumps(data).encode(), 9)
+
+
+def unpack(payload):
+    data = json.loads(zlib.decompress(bytes(payload)))
+    data.setdefault('history', [])
+    for item in [data] + data['history'] + [f['metrics'] for f in data['files'] if f['metrics']]:
+        for name in DATETIME_FIELDS:
+            if item.get(name):
+                item[name] = parse_datetime(item[name])
+    return data
+
+
+def archive_homework(homework, chunk_size=500):
+    """Moves one homework's submissions to the archive; every chunk commits on its own, so a rerun resumes."""
+    archived = 0
+    while True:
+        with transaction.atomic():
+            submissions = list(
+                Submission.objects.filter(homework=homework).order_by('pk')
+                .select_related('grade').prefetch_related('files__metrics', 'file_versions')[:chunk_size]
+            )
+            if not submissions:
+                break
+            ArchivedSubmission.objects.bulk_create([
+                ArchivedSubmission(original_id=s.pk, homework_id=s.homework_id, student_id=s.student_id,
+                                   final_grade=s.final_grade, submitted_at=s.submitted_at, payload=pack(s))
+                for s in submissions
+            ], ignore_conflicts=True)
+            Submission.objects.filter(pk__in=[s.pk for s in submissions]).delete()
+        archived += len(submissions)
+
+    Homework.objects.filter(pk=homework.pk).update(archived_at=timezone.now())
+    invalidate()
+    return archived
+
+
+def archivable_homeworks(retention_days):
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    return Homework.objects.filter(deadline__lt=cutoff, archived_at__isnull=True).order_by('deadline')
+
+
+@transaction.atomic
+def rehydrate(archived):
+    """Restores an archived submission under its original id and drops the archive row."""
+    data = unpack(archived.payload)
+    files, grade, file_history = data.pop('files'), data.pop('grade'), data.pop('history')
+    # bulk_create skips save(), so score rollups and metrics scheduling are not replayed
+    submission = Submission.objects.bulk_create([Submission(**data)])[0]
+    # auto_now_add fields are reset by bulk_create, put the original timestamps back
+    Submission.objects.filter(pk=submission.pk).update(submitted_at=data['submitted_at'],
+                                                       created_at=data['created_at'])
+    SubmissionFile.objects.bulk_create([
+        SubmissionFile(submission_id=submission.pk, **{k: v for k, v in f.items() if k != 'metrics'})
+        for f in files
+    ])
+    SubmissionFileMetrics.objects.bulk_create([
+        SubmissionFileMetrics(file_id=f['id'], **f['metrics']) for f in files if f['metrics']
+    ])
+    SubmissionFileVersion.objects.bulk_create([
+        SubmissionFileVersion(submission_id=submission.pk, **row) for row in file_history
+    ])
+    if grade:
+        Grade.objects.bulk_create([Grade(submission_id=submission.pk, **grade)])
+    archived.delete()
+    Homework.objects.filter(pk=submission.homework_id).update(archived_at=None)
+    invalidate()
+    return submission
+
+
+def student_totals(**lookup):
+    """Sums final grades per student over live and archived submissions."""
+    totals = {}
+    for model in (Submission, ArchivedSubmission):
+        # Homeworks being deleted are hidden everywhere, scores included
+        rows = (model.objects.filter(final_grade__isnull=False, homework__deleting_at__isnull=True, **lookup)
+                .values('student').annotate(total=Sum('final_grade')).values_list('student', 'total'))
+        for student_id, total in rows:
+            totals[student_id] = totals.get(student_id, 0) + total
+    return totals
+
+
+def total_score_expression():
+    """Annotation for User querysets: live plus archived final grades."""
+    parts = []
+    for model in (Submission, ArchivedSubmission):
+        subquery = (model.objects.filter(student=OuterRef('pk'), final_grade__isnull=False,
+                                         homework__deleting_at__isnull=True)
+                    .values('student').annotate(total=Sum('final_grade')).values('total'))
+        parts.append(Coalesce(Subquery(subquery, output_field=FloatField()), Value(0.0)))
+    return parts[0] + parts[1]
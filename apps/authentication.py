@@ -2,7 +2,14 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from django.utils import timezone
-from .models import Session
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Session, TokenClaimsUser
+from .tokens import TOKEN_VERSION_CLAIM, current_token_version
+from .write_queue import get_write_queue
 
 
 class TokenAuthentication(BaseAuthentication):
@@ -21,12 +28,37 @@ class TokenAuthentication(BaseAuthentication):
                 session.delete()
                 raise AuthenticationFailed('Token expired')
 
-            # Update last login
-            session.last_login = timezone.now()
-            session.save()
+            # Update last login; nothing in the response depends on it, so it is queued
+            get_write_queue().submit(Session.objects.filter(pk=session.pk).update, last_login=timezone.now())
 
             return (session.user, token)
 
         except Session.DoesNotExist:
             raise AuthenticationFailed('Invalid token')
 
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Trusts the role and group_id claims of the access token instead of loading the user row.
+    The token version claim is checked against a cached per-user version, so changing
+    role, group or is_active invalidates outstanding tokens and forces a refresh.
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            # Token issued before claims were added
+            return super().get_user(validated_token)
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValueError):
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        if current_token_version(user_id) != validated_token[TOKEN_VERSION_CLAIM]:
+            raise InvalidToken('Token claims are outdated, refresh the token')
+        return TokenClaimsUser.from_claims(user_id, validated_token['role'], validated_token['group_id'],
+                                           validated_token[TOKEN_VERSION_CLAIM])
+
+
+class ClaimsJWTScheme(SimpleJWTScheme):
+    # Same Bearer scheme in the OpenAPI schema as plain SimpleJWT
+    target_class = 'apps.authentication.ClaimsJWTAuthentication'
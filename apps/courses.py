@@ -0,0 +1,154 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from apps.models import (ArchivedSubmission, CourseGroupStats, CourseHomeworkStats, CourseStanding, Group, Homework,
+                         Submission, User)
+
+
+def _bump(model, lookup, values=None, **deltas):
+    """Adds deltas to the row matching lookup (and sets values), creating the row on first use."""
+    values = values or {}
+    changes = {**{k: F(k) + v for k, v in deltas.items()}, **values}
+    with transaction.atomic():
+        if model.objects.filter(**lookup).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **values, **deltas)
+        except IntegrityError:
+            # Another writer created the row first
+            model.objects.filter(**lookup).update(**changes)
+
+
+def group_course_id(group_id):
+    return Group.objects.filter(pk=group_id).values_list('course_id', flat=True).first()
+
+
+def record_submission(homework, student_id):
+    """First version of a submission: counts towards completion."""
+    course_id = group_course_id(homework.group_id)
+    if course_id is None:
+        return
+    _bump(CourseStanding, {'course_id': course_id, 'student_id': student_id}, {'group_id': homework.group_id},
+          submitted=1)
+    _bump(CourseGroupStats, {'course_id': course_id, 'group_id': homework.group_id}, submitted=1)
+    _bump(CourseHomeworkStats, {'course_id': course_id, 'template': homework.template}, submitted=1)
+
+
+def record_grade_change(homework, student_id, previous, new):
+    course_id = group_course_id(homework.group_id)
+    if course_id is None:
+        return
+    delta = (new or 0) - (previous or 0)
+    graded = (new is not None) - (previous is not None)
+    _bump(CourseStanding, {'course_id': course_id, 'student_id': student_id}, total_score=delta, graded=graded)
+    _bump(CourseGroupStats, {'course_id': course_id, 'group_id': homework.group_id}, score_sum=delta, graded=graded)
+    _bump(CourseHomeworkStats, {'course_id': course_id, 'template': homework.template},
+          score_sum=delta, graded=graded)
+
+
+def record_homework(homework):
+    course_id = group_course_id(homework.group_id)
+    if course_id is None:
+        return
+    assigned = User.objects.filter(group_id=homework.group_id, role='student').count()
+    _bump(CourseHomeworkStats, {'course_id': course_id, 'template': homework.template},
+          homeworks=1, assigned=assigned)
+
+
+def record_group(group):
+    CourseGroupStats.objects.get_or_create(course_id=group.course_id, group_id=group.pk)
+
+
+def _assign(course_id, group_id, sign):
+    # The student joins or leaves every homework already given to the group
+    _bump(CourseGroupStats, {'course_id': course_id, 'group_id': group_id}, students=sign)
+    homeworks = (Homework.objects.filter(group_id=group_id, deleting_at__isnull=True).order_by()
+                 .values_list('template').annotate(Count('pk')))
+    for template, count in homeworks:
+        _bump(CourseHomeworkStats, {'course_id': course_id, 'template': template}, assigned=sign * count)
+
+
+def record_membership(student_id, old_group_id, new_group_id):
+    courses = dict(Group.objects.filter(pk__in=[old_group_id, new_group_id]).values_list('pk', 'course_id'))
+    if courses.get(old_group_id):
+        _assign(courses[old_group_id], old_group_id, -1)
+    if courses.get(new_group_id):
+        _assign(courses[new_group_id], new_group_id, 1)
+        _bump(CourseStanding, {'course_id': courses[new_group_id], 'student_id': student_id},
+              {'group_id': new_group_id})
+
+
+def _totals(key, group_ids):
+    # Archived submissions still count, like everywhere else scores are summed
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for model in (Submission, ArchivedSubmission):
+        rows = (model.objects.filter(homework__group_id__in=group_ids, homework__deleting_at__isnull=True)
+                .order_by().values_list(key)
+                .annotate(Count('pk'), Count('final_grade'), Sum('final_grade')))
+        for value, submitted, graded, score in rows:
+            total = totals[value]
+            total[0] += submitted
+            total[1] += graded
+            total[2] += score or 0
+    return totals
+
+
+def refresh_course(course_id):
+    """Rebuilds the three aggregate tables of one course from the submissions."""
+    with transaction.atomic():
+        for model in (CourseStanding, CourseHomeworkStats, CourseGroupStats):
+            model.objects.filter(course_id=course_id).delete()
+        group_ids = list(Group.objects.filter(course_id=course_id, deleting_at__isnull=True)
+                         .values_list('pk', flat=True))
+        if not group_ids:
+            return
+
+        members = dict(User.objects.filter(role='student', group_id__in=group_ids).values_list('pk', 'group_id'))
+        group_sizes = defaultdict(int)
+        for group_id in members.values():
+            group_sizes[group_id] += 1
+
+        by_student = _totals('student_id', group_ids)
+        CourseStanding.objects.bulk_create([
+            CourseStanding(course_id=course_id, student_id=student_id, group_id=members.get(student_id),
+                           submitted=t[0], graded=t[1], total_score=t[2])
+            for student_id, t in ((pk, by_student.get(pk, [0, 0, 0.0])) for pk in set(members) | set(by_student))
+        ], batch_size=1000)
+
+        by_group = _totals('homework__group_id', group_ids)
+        CourseGroupStats.objects.bulk_create([
+            CourseGroupStats(course_id=course_id, group_id=group_id, students=group_sizes[group_id],
+                             submitted=by_group[group_id][0], graded=by_group[group_id][1],
+                             score_sum=by_group[group_id][2])
+            for group_id in group_ids
+        ])
+
+        by_template = _totals('homework__template', group_ids)
+        templates = defaultdict(lambda: [0, 0])
+        for template, group_id in Homework.objects.filter(group_id__in=group_ids, deleting_at__isnull=True) \
+                .values_list('template', 'group_id'):
+            templates[template][0] += 1
+            templates[template][1] += group_sizes[group_id]
+        CourseHomeworkStats.objects.bulk_create([
+            CourseHomeworkStats(course_id=course_id, template=template, homeworks=homeworks, assigned=assigned,
+                                submitted=by_template[template][0], graded=by_template[template][1],
+                                score_sum=by_template[template][2])
+            for template, (homeworks, assigned) in templates.items()
+        ])
+
+
+def courses_of(instance):
+    """Courses whose aggregates a delete of instance (a Group, Homework or User) would make stale."""
+    if isinstance(instance, Group):
+        ids = {instance.course_id}
+    elif isinstance(instance, Homework):
+        ids = {group_course_id(instance.group_id)}
+    elif isinstance(instance, User):
+        ids = set(CourseStanding.objects.filter(student=instance).values_list('course_id', flat=True))
+        ids |= set(Group.objects.filter(teacher=instance).values_list('course_id', flat=True))
+    else:
+        ids = set()
+    return ids - {None}
@@ -0,0 +1,128 @@
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.courses import courses_of, refresh_course
+from apps.models import DeletionJob, Group, Homework, Submission, User
+from apps.tokens import forget_token_version
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Rough size of what a delete would cascade into, used to decide between inline and background delete
+SIZE_ESTIMATES = {
+    Group: lambda obj: Q(homework__group=obj),
+    Homework: lambda obj: Q(homework=obj),
+    User: lambda obj: Q(student=obj) | Q(homework__teacher=obj) | Q(homework__group__teacher=obj),
+}
+
+
+# Rows that go with the target and must be hidden with it, not only once the purger reaches them
+DEPENDENTS = {
+    Group: lambda obj: [Homework.objects.filter(group=obj)],
+    Homework: lambda obj: [],
+    User: lambda obj: [Group.objects.filter(teacher=obj),
+                       Homework.objects.filter(Q(teacher=obj) | Q(group__teacher=obj))],
+}
+
+
+def estimate(instance):
+    return Submission.objects.filter(SIZE_ESTIMATES[type(instance)](instance)).count()
+
+
+def schedule_deletion(instance):
+    """
+    Marks a large object, and the groups and homeworks that go with it, as being deleted and queues
+    a DeletionJob; returns None when it is small enough to delete inline.
+    """
+    size = estimate(instance)
+    if size < getattr(settings, 'DELETION_INLINE_LIMIT', 1000):
+        return None
+    instance.deleting_at = timezone.now()
+    update_fields = ['deleting_at']
+    if isinstance(instance, User):
+        # Blocks login and JWT auth right away
+        instance.is_active = False
+        update_fields.append('is_active')
+    with transaction.atomic():
+        type(instance).objects.filter(pk=instance.pk).update(**{f: getattr(instance, f) for f in update_fields})
+        for queryset in DEPENDENTS[type(instance)](instance):
+            queryset.filter(deleting_at__isnull=True).update(deleting_at=instance.deleting_at)
+        job = DeletionJob.objects.create(target_model=instance._meta.label_lower, target_id=instance.pk,
+                                         estimated_rows=size)
+    if isinstance(instance, User):
+        forget_token_version(instance.pk)
+    return job
+
+
+def _raw_delete(model, ids):
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({placeholders})',
+                       list(ids))
+        return cursor.rowcount
+
+
+class Purger:
+    def __init__(self, job, batch_size=BATCH_SIZE, progress=None):
+        self.job = job
+        self.batch_size = batch_size
+        self.progress = progress
+
+    def report(self, step, rows):
+        DeletionJob.objects.filter(pk=self.job.pk).update(
+            deleted_rows=F('deleted_rows') + rows, current_step=step, updated_at=timezone.now())
+        self.job.deleted_rows += rows
+        if self.progress:
+            self.progress(self.job, step)
+
+    def purge_dependents(self, model, ids):
+        """Deletes everything that cascades from model rows `ids`, leaves first, in bounded batches."""
+        for rel in model._meta.related_objects:
+            if rel.many_to_many or rel.field.model._meta.auto_created:
+                continue
+            child = rel.related_model
+            lookup = {f'{rel.field.name}__in': ids}
+            if rel.on_delete is models.CASCADE:
+                while True:
+                    child_ids = list(child._base_manager.filter(**lookup).values_list('pk', flat=True)[:self.batch_size])
+                    if not child_ids:
+                        break
+                    self.purge_dependents(child, child_ids)
+                    self.report(child._meta.label_lower, _raw_delete(child, child_ids))
+            elif rel.on_delete is models.SET_NULL:
+                while True:
+                    child_ids = list(child._base_manager.filter(**lookup).values_list('pk', flat=True)[:self.batch_size])
+                    if not child_ids:
+                        break
+                    child._base_manager.filter(pk__in=child_ids).update(**{rel.field.name: None})
+
+    def run(self):
+        model = apps.get_model(self.job.target_model)
+        self.purge_dependents(model, [self.job.target_id])
+        # The target itself goes through the ORM: only small leftovers (M2M rows, admin log) remain by now
+        deleted, _ = model._base_manager.filter(pk=self.job.target_id).delete()
+        self.report(self.job.target_model, deleted)
+
+
+def run_job(job, batch_size=BATCH_SIZE, progress=None):
+    DeletionJob.objects.filter(pk=job.pk).update(status='running')
+    target = apps.get_model(job.target_model)._base_manager.filter(pk=job.target_id).first()
+    courses = courses_of(target) if target is not None else set()
+    try:
+        Purger(job, batch_size, progress).run()
+    except Exception as exc:
+        logger.exception('Deletion job %s failed', job.pk)
+        DeletionJob.objects.filter(pk=job.pk).update(status='failed', last_error=str(exc))
+        return False
+    # Raw batch deletes bypass the incremental course counters
+    for course_id in courses:
+        refresh_course(course_id)
+    DeletionJob.objects.filter(pk=job.pk).update(status='done', current_step='')
+    return True
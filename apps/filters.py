@@ -0,0 +1,35 @@
+from django_filters import rest_framework as filters
+from rest_framework.filters import BaseFilterBackend
+
+from apps.models import User
+from apps.search import directory_q
+
+
+class UserDirectoryFilter(filters.FilterSet):
+    group = filters.NumberFilter(field_name='group_id')
+    no_group = filters.BooleanFilter(field_name='group', lookup_expr='isnull')
+
+    class Meta:
+        model = User
+        fields = ['group', 'no_group']
+
+
+class DirectorySearchFilter(BaseFilterBackend):
+    """?search= matches the start of fullname, username or phone through the normalized search columns."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+        # No ORDER BY: sorting every prefix match would cost more than the indexed lookup itself
+        return queryset.filter(directory_q(term))
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Prefix of fullname, username or phone',
+            'schema': {'type': 'string'},
+        }]
@@ -0,0 +1,27 @@
+import logging
+
+from apps.courses import group_course_id, refresh_course
+from apps.models import Homework
+from apps.sandbox import SandboxUnavailable, run_homework_tests
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_grading(sender, homework_ids, **kwargs):
+    # Submissions are final at the deadline; results arrive from the sandbox pool
+    homeworks = Homework.objects.filter(pk__in=homework_ids, deleting_at__isnull=True, test_cases__isnull=False) \
+        .distinct()
+    for homework in homeworks:
+        try:
+            stats = run_homework_tests(homework)
+        except SandboxUnavailable as exc:
+            logger.warning('Deadline of homework %s: not graded: %s', homework.pk, exc)
+            continue
+        logger.info('Deadline of homework %s: %s', homework.pk, stats)
+
+
+def recompute_standings(sender, homework_ids, **kwargs):
+    # Reconciles the course standings with everything submitted before the deadline
+    group_ids = set(Homework.objects.filter(pk__in=homework_ids).values_list('group_id', flat=True))
+    for course_id in {group_course_id(group_id) for group_id in group_ids} - {None}:
+        refresh_course(course_id)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.archive import archivable_homeworks, archive_homework
+
+
+class Command(BaseCommand):
+    help = 'Move submissions of homeworks past the retention window into ArchivedSubmission'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=180)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many homeworks')
+
+    def handle(self, *args, **options):
+        homeworks = archivable_homeworks(options['retention_days'])
+        if options['limit']:
+            homeworks = homeworks[:options['limit']]
+
+        total = 0
+        for homework in homeworks.iterator():
+            count = archive_homework(homework, chunk_size=options['chunk_size'])
+            total += count
+            self.stdout.write(f'{homework}: {count} submissions archived')
+        self.stdout.write(self.style.SUCCESS(f'{total} submissions archived'))
@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from apps.metrics import compute_row, store_metrics
+from apps.models import SubmissionFile
+
+
+class Command(BaseCommand):
+    help = 'Compute code metrics for submission files that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--all', action='store_true', help='Recompute metrics for every file')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        files = SubmissionFile.objects.order_by('pk')
+        if not options['all']:
+            files = files.filter(metrics__isnull=True)
+
+        done = 0
+        last_pk = 0
+        # A single pool for the whole run; chunks are walked by primary key so memory stays flat
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                chunk = list(files.filter(pk__gt=last_pk).values_list('pk', 'content')[:chunk_size])
+                if not chunk:
+                    break
+                last_pk = chunk[-1][0]
+                per_worker = max(1, len(chunk) // (options['workers'] * 4))
+                store_metrics(list(pool.map(compute_row, chunk, chunksize=per_worker)))
+                done += len(chunk)
+                self.stdout.write(f'{done} files processed')
+
+        self.stdout.write(self.style.SUCCESS(f'Metrics computed for {done} files'))
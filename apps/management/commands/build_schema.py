@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.schema import build_schema
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema once and store it as a gzip artifact served by /api/schema/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(settings.SPECTACULAR_SCHEMA_PATH))
+
+    def handle(self, *args, **options):
+        size = build_schema(options['path'])
+        self.stdout.write(self.style.SUCCESS(f"Schema written to {options['path']} ({size} bytes uncompressed)"))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.rollups import compact
+
+
+class Command(BaseCommand):
+    help = 'Merge old daily score snapshots into weekly buckets and old weekly ones into monthly buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--daily-days', type=int, default=60, help='Keep daily snapshots this many days')
+        parser.add_argument('--weekly-days', type=int, default=180, help='Keep weekly snapshots this many days')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        days = compact('day', 'week', today - timedelta(days=options['daily_days']))
+        weeks = compact('week', 'month', today - timedelta(days=options['weekly_days']))
+        self.stdout.write(self.style.SUCCESS(f'Compacted {days} daily and {weeks} weekly snapshots'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.snapshot import import_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Load a snapshot written by export_snapshot into empty tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--pseudonymize', action='store_true', help='Replace names, emails, phones and password hashes')
+        parser.add_argument('--password', help='Give every imported user this password')
+        parser.add_argument('--replace', action='store_true', help='Delete existing rows of the imported tables first')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            loaded = import_snapshot(
+                options['path'], chunk_size=options['chunk_size'], pseudonymize=options['pseudonymize'],
+                password=options['password'], replace=options['replace'],
+                progress=lambda label, rows: self.stdout.write(f'{label}: {rows} rows'),
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(loaded.values())} rows imported in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.deletion import BATCH_SIZE, run_job
+from apps.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = 'Delete groups, homeworks and users queued for background deletion in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--once', action='store_true', help='Process queued jobs and exit')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls')
+        parser.add_argument('--retry-failed', action='store_true')
+
+    def progress(self, job, step):
+        self.stdout.write(f'job {job.pk}: {job.deleted_rows}/{job.estimated_rows}+ rows, {step}')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'running'] + (['failed'] if options['retry_failed'] else [])
+        while True:
+            # 'running' jobs are ones interrupted mid-way; deletion is idempotent so they simply resume
+            for job in DeletionJob.objects.filter(status__in=statuses):
+                ok = run_job(job, options['batch_size'], self.progress)
+                style = self.style.SUCCESS if ok else self.style.ERROR
+                self.stdout.write(style(f'job {job.pk}: {"done" if ok else "failed"}'))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from apps.courses import refresh_course
+from apps.models import Course, Homework
+from apps.search import normalize_text
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-course standings and statistics tables from the submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='Courses to rebuild; all of them by default')
+
+    def handle(self, *args, **options):
+        # Homeworks created before templates existed are grouped by their title
+        untemplated = list(Homework.objects.filter(template='').only('pk', 'title'))
+        for homework in untemplated:
+            homework.template = normalize_text(homework.title)[:200]
+        Homework.objects.bulk_update(untemplated, ['template'], batch_size=1000)
+
+        courses = Course.objects.order_by('pk')
+        if options['course_ids']:
+            courses = courses.filter(pk__in=options['course_ids'])
+        done = 0
+        for course_id in courses.values_list('pk', flat=True):
+            refresh_course(course_id)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'{done} courses rebuilt'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.models import User
+from apps.search import normalize_phone, normalize_text
+
+
+class Command(BaseCommand):
+    help = 'Fill the normalized search columns of users created before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        last_pk, done = 0, 0
+        while True:
+            users = list(User.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .only('pk', 'fullname', 'username', 'phone')[:options['chunk_size']])
+            if not users:
+                break
+            for user in users:
+                user.search_fullname = normalize_text(user.fullname)
+                user.search_username = normalize_text(user.username)
+                user.search_phone = normalize_phone(user.phone)
+            User.objects.bulk_update(users, ['search_fullname', 'search_username', 'search_phone'])
+            last_pk = users[-1].pk
+            done += len(users)
+        if connection.vendor == 'sqlite':
+            # Without statistics SQLite prefers the low-selectivity role index over the search ones
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE apps_user')
+        self.stdout.write(self.style.SUCCESS(f'{done} users reindexed'))
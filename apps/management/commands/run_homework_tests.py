@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.models import Homework
+from apps.sandbox import SandboxUnavailable, run_homework_tests, warm_up
+
+
+class Command(BaseCommand):
+    help = "Run a homework's test cases against all of its submissions and report throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('homework_id', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            homework = Homework.objects.get(pk=options['homework_id'])
+        except Homework.DoesNotExist:
+            raise CommandError('Homework not found')
+
+        warm_up()
+        try:
+            stats = run_homework_tests(homework, wait_for_results=True)
+        except SandboxUnavailable as exc:
+            raise CommandError(str(exc))
+        if not stats['unique']:
+            self.stdout.write('Nothing to run: no test cases or no submissions')
+            return
+        self.stdout.write(f"{stats['submissions']} submissions, {stats['unique']} distinct, "
+                          f"{stats['cached']} from cache, {stats['executed']} executed")
+        if stats['executed']:
+            self.stdout.write(f"{stats['test_runs']} test runs in {stats['seconds']}s: "
+                              f"{stats['runs_per_second']} runs/s, {stats['submissions_per_second']} submissions/s")
+        self.stdout.write(self.style.SUCCESS('Grades updated'))
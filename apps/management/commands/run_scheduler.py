@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.scheduler import HomeworkScheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the homework lifecycle scheduler (start_date and deadline events)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=1.0, help='Seconds between checks')
+        parser.add_argument('--horizon', type=int, default=300, help='Seconds of upcoming jobs kept in memory')
+        parser.add_argument('--once', action='store_true', help='Fire due jobs and exit')
+
+    def handle(self, *args, **options):
+        scheduler = HomeworkScheduler(tick=options['tick'], horizon=timedelta(seconds=options['horizon']))
+        if options['once']:
+            fired = scheduler.run_once()
+            self.stdout.write(self.style.SUCCESS(f'{fired} jobs fired'))
+            return
+
+        self.stdout.write('Scheduler started')
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler stopped')
@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+
+def _writer(index, iterations, homework_id, student_id, session_id, results):
+    from apps.models import Homework, Session, Submission, User, UserSession
+    from apps.versioning import submit
+
+    homework = Homework.objects.get(pk=homework_id)
+    student = User.objects.get(pk=student_id)
+    latencies, locked, failed = [], 0, 0
+    for i in range(iterations):
+        started = time.monotonic()
+        try:
+            # What a deadline looks like: resubmissions, grading, token touches and new login sessions
+            submission = submit(homework, student)
+            with transaction.atomic():
+                # Read, then write in the same transaction: the lock upgrade a deferred transaction cannot wait for
+                submission = Submission.objects.get(pk=submission.pk)
+                submission.final_grade = i % 10
+                submission.save(update_fields=['final_grade'])
+            Session.objects.filter(pk=session_id).update(last_login=timezone.now())
+            UserSession.objects.create(user=student, refresh_token='x', jti=f'{index}-{i}')
+            list(Homework.objects.filter(group_id=homework.group_id)[:20])
+        except OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                locked += 1
+            else:
+                failed += 1
+        latencies.append(time.monotonic() - started)
+    connection.close()
+    results.put((latencies, locked, failed))
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent writer processes against a scratch copy of the schema and count lock errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--baseline', action='store_true',
+                            help="Use Django's default SQLite options instead of the configured ones")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+        writers, iterations = options['writers'], options['iterations']
+
+        if connection.is_in_memory_db():
+            raise CommandError('The default database is in memory; closing it would drop it')
+
+        # Never touch the real database: point the default alias at a throwaway file
+        workdir = tempfile.mkdtemp(prefix='sqlite-stress-')
+        saved = {key: connection.settings_dict[key] for key in ('NAME', 'OPTIONS')}
+        connections.close_all()
+        connection.settings_dict['NAME'] = os.path.join(workdir, 'stress.sqlite3')
+        if options['baseline']:
+            connection.settings_dict['OPTIONS'] = {}
+        try:
+            ids = self.prepare(writers)
+            ctx = multiprocessing.get_context('fork')
+            results = ctx.Queue()
+            processes = [ctx.Process(target=_writer, args=(n, iterations, ids['homework'], student, session, results))
+                         for n, (student, session) in enumerate(ids['writers'])]
+            started = time.monotonic()
+            for p in processes:
+                p.start()
+            collected = [results.get() for _ in processes]
+            for p in processes:
+                p.join()
+            elapsed = time.monotonic() - started
+        finally:
+            connections.close_all()
+            # The settings dict is shared with django.conf.settings, so callers (tests) get theirs back
+            connection.settings_dict.update(saved)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        latencies = sorted(t for lat, _, _ in collected for t in lat)
+        locked = sum(c[1] for c in collected)
+        failed = sum(c[2] for c in collected)
+        self.stdout.write(f'{writers} writers x {iterations} iterations in {elapsed:.2f}s '
+                          f'({len(latencies) / elapsed:.0f} iterations/s)')
+        self.stdout.write(f'latency p50 {statistics.median(latencies) * 1000:.1f}ms, '
+                          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms, '
+                          f'max {latencies[-1] * 1000:.1f}ms')
+        if locked or failed:
+            raise CommandError(f'{locked} "database is locked" errors, {failed} other database errors')
+        self.stdout.write(self.style.SUCCESS('No lock errors'))
+
+    def prepare(self, writers):
+        from apps.models import Group, Homework, Session, User
+
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        now = timezone.now()
+        teacher = User.objects.create(username='stress-teacher', role='teacher', fullname='Teacher')
+        group = Group.objects.create(name='stress', teacher=teacher)
+        homework = Homework.objects.create(title='Stress', description='', points=10, teacher=teacher, group=group,
+                                           start_date=now - timedelta(days=1), deadline=now + timedelta(days=1))
+        pairs = []
+        for n in range(writers):
+            student = User.objects.create(username=f'stress-{n}', role='student', fullname=f'Student {n}',
+                                          group=group)
+            session = Session.objects.create(user=student, ip_address='127.0.0.1', expires_at=now + timedelta(days=1))
+            pairs.append((student.pk, session.pk))
+        # Forked writers must open their own connections
+        connections.close_all()
+        return {'homework': homework.pk, 'writers': pairs}
@@ -0,0 +1,87 @@
+import ast
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from apps.write_queue import queue_result
+
+METRIC_FIELDS = ('line_count', 'non_blank_lines', 'comment_lines', 'function_count',
+                 'class_count', 'cyclomatic_complexity', 'parsed_ok')
+
+# Every branching node adds one path to the cyclomatic complexity
+BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+                ast.Assert, ast.comprehension, ast.match_case)
+COMMENT_PREFIXES = ('#', '//', '/*', '*', '--')
+
+_executor = None
+
+
+def compute_metrics(content):
+    # Pure stdlib so worker processes never need Django set up
+    lines = content.split('\n') if content else []
+    stripped = [line.strip() for line in lines]
+    result = {
+        'line_count': len(lines),
+        'non_blank_lines': sum(1 for line in stripped if line),
+        'comment_lines': sum(1 for line in stripped if line.startswith(COMMENT_PREFIXES)),
+        'function_count': 0,
+        'class_count': 0,
+        'cyclomatic_complexity': 0,
+        'parsed_ok': False,
+    }
+    try:
+        tree = ast.parse(content or '')
+    except (SyntaxError, ValueError):
+        return result
+
+    complexity = 1
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            result['function_count'] += 1
+        elif isinstance(node, ast.ClassDef):
+            result['class_count'] += 1
+        elif isinstance(node, BRANCH_NODES):
+            complexity += 1
+        elif isinstance(node, ast.BoolOp):
+            complexity += len(node.values) - 1
+    result['cyclomatic_complexity'] = complexity
+    result['parsed_ok'] = True
+    return result
+
+
+def compute_row(item):
+    pk, content = item
+    return pk, compute_metrics(content)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'CODE_METRICS_WORKERS', None) or os.cpu_count()
+        # Spawned: forking a web process copies locks held by its write-queue and session-buffer threads
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def store_metrics(rows):
+    from apps.models import SubmissionFile, SubmissionFileMetrics
+
+    # A resubmission may have removed the file while its metrics were being computed
+    existing = set(SubmissionFile.objects.filter(pk__in=[pk for pk, _ in rows]).values_list('pk', flat=True))
+    objs = [SubmissionFileMetrics(file_id=pk, **values) for pk, values in rows if pk in existing]
+    SubmissionFileMetrics.objects.bulk_create(
+        objs, update_conflicts=True, unique_fields=['file'], update_fields=list(METRIC_FIELDS) + ['computed_at']
+    )
+
+
+def store_row(row):
+    store_metrics([row])
+
+
+def schedule_metrics(file_id, content):
+    # Parsing happens in the pool and the write in the callback, never in the request
+    future = get_executor().submit(compute_row, (file_id, content))
+    future.add_done_callback(queue_result(store_row))
+    return future
@@ -1,5 +1,5 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password, check_password
 from django.db.models import Model, ForeignKey, TextField, CASCADE, CharField, GenericIPAddressField, DateTimeField
 from django.utils import timezone
@@ -20,8 +20,32 @@ class Group(models.Model):
     name = models.CharField(max_length=100)
     teacher = models.ForeignKey('User', on_delete=models.CASCADE,
                                 limit_choices_to={'role': 'teacher'}, related_name='teaching_groups')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='groups')
+    deleting_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_course_id = instance.__dict__.get('course_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        previous = getattr(self, '_saved_course_id', None)
+        super().save(*args, **kwargs)
+        if adding:
+            # A new group has no students or submissions yet: only its stats row is missing
+            if self.course_id is not None:
+                from apps.courses import record_group
+                record_group(self)
+        elif self.course_id != previous:
+            # Moving a group changes both courses wholesale, so recompute rather than patch
+            from apps.courses import refresh_course
+            for course_id in {previous, self.course_id} - {None}:
+                refresh_course(course_id)
+        self._saved_course_id = self.course_id
+
     @property
     def student_count(self):
         return self.students.count()
@@ -43,11 +67,88 @@ class User(AbstractUser):
     role = CharField(max_length=50, choices=ROLE_CHOICES, default='student')
     fullname = models.CharField(max_length=100)
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, related_name="students")
+    deleting_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)  # Changed to DateTimeField for consistency
+    # Normalized copies for indexed prefix search, kept in sync by save()
+    search_fullname = models.CharField(max_length=100, blank=True, editable=False)
+    search_username = models.CharField(max_length=150, blank=True, editable=False)
+    search_phone = models.CharField(max_length=20, blank=True, editable=False)
+    # Bumped whenever a field embedded in access tokens changes, so older tokens stop authenticating
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    CLAIM_FIELDS = ('role', 'group_id', 'is_active')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_claims = {f: instance.__dict__[f] for f in cls.CLAIM_FIELDS if f in instance.__dict__}
+        return instance
+
+    def save(self, *args, **kwargs):
+        from apps.search import normalize_text, normalize_phone
+        self.search_fullname = normalize_text(self.fullname)
+        self.search_username = normalize_text(self.username)
+        self.search_phone = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'fullname', 'username', 'phone'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'search_fullname', 'search_username', 'search_phone'}
+        saved_claims = getattr(self, '_saved_claims', {})
+        claims_changed = any(getattr(self, f) != value for f, value in saved_claims.items())
+        adding = self._state.adding
+        previous_group = None if adding else saved_claims.get('group_id', self.group_id)
+        if claims_changed:
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'token_version'}
+        super().save(*args, **kwargs)
+        if claims_changed:
+            from apps.tokens import publish_token_version
+            publish_token_version(self.pk, self.token_version)
+        if adding or claims_changed:
+            # A created instance has no from_db snapshot; without one its next save would see no change
+            self._saved_claims = {f: getattr(self, f) for f in (self.CLAIM_FIELDS if adding else saved_claims)}
+        if self.role == 'student' and self.group_id != previous_group:
+            from apps.courses import record_membership
+            record_membership(self.pk, previous_group, self.group_id)
+
+    def delete(self, *args, **kwargs):
+        from apps.tokens import forget_token_version
+        user_id = self.pk
+        result = super().delete(*args, **kwargs)
+        forget_token_version(user_id)
+        return result
 
     def __str__(self):
         return f"{self.fullname} ({self.username})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role', 'group']),
+            models.Index(fields=['role', 'search_fullname']),
+            models.Index(fields=['role', 'search_username']),
+            models.Index(fields=['role', 'search_phone']),
+        ]
+
+
+class TokenClaimsUser(User):
+    """
+    User built from access token claims by ClaimsJWTAuthentication, without a query.
+    Touching any field the token does not carry loads the rest of the row in one go.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, role, group_id, token_version):
+        return cls.from_db(None, ['id', 'role', 'group_id', 'token_version'], [user_id, role, group_id, token_version])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using, fields, from_queryset)
+
 
 class Session(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
@@ -79,8 +180,54 @@ class Homework(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='homeworks')
     file_extension = models.CharField(max_length=10, default='.py')
     ai_grading_prompt = models.TextField(blank=True)
+    # Same homework given to several groups of a course; defaults to the normalized title
+    template = models.CharField(max_length=200, blank=True, db_index=True)
+    STATUS_CHOICES = (
+        ('scheduled', 'Scheduled'),
+        ('open', 'Open'),
+        ('closed', 'Closed'),
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled', db_index=True)
+    archived_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    deleting_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_placement = (instance.__dict__.get('group_id'), instance.__dict__.get('template'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The scheduler flips status at the exact time; this only keeps edits consistent
+        now = timezone.now()
+        if now >= self.deadline:
+            self.status = 'closed'
+        elif now >= self.start_date:
+            self.status = 'open'
+        else:
+            self.status = 'scheduled'
+        if not self.template:
+            from apps.search import normalize_text
+            self.template = normalize_text(self.title)[:200]
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        HomeworkJob.sync_for(self)
+        from apps.courses import group_course_id, record_homework, refresh_course
+        saved_group, saved_template = getattr(self, '_saved_placement', (self.group_id, self.template))
+        if adding:
+            record_homework(self)
+        elif saved_group is not None and (saved_group, saved_template) != (self.group_id, self.template):
+            # Moved to another group or template: the counters cannot follow, so rebuild
+            for course_id in {group_course_id(saved_group), group_course_id(self.group_id)} - {None}:
+                refresh_course(course_id)
+        self._saved_placement = (self.group_id, self.template)
+
+    @property
+    def accepts_submissions(self):
+        # A homework being deleted is hidden at once; new rows would only race the purger
+        return self.status == 'open' and self.deleting_at is None
+
     def __str__(self):
         return f"{self.title} - {self.group.name}"
 
@@ -88,6 +235,43 @@ class Homework(models.Model):
         ordering = ['-created_at']
 
 
+class HomeworkJob(models.Model):
+    EVENT_CHOICES = (
+        ('start', 'Start'),
+        ('deadline', 'Deadline'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    homework = models.ForeignKey(Homework, on_delete=models.CASCADE, related_name='jobs')
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    run_at = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def sync_for(cls, homework):
+        # Rescheduling only touches events whose time actually moved
+        dates = {'start': homework.start_date, 'deadline': homework.deadline}
+        cls.objects.bulk_create([cls(homework=homework, event=event, run_at=run_at)
+                                 for event, run_at in dates.items()], ignore_conflicts=True)
+        for event, run_at in dates.items():
+            cls.objects.filter(homework=homework, event=event).exclude(run_at=run_at).update(
+                run_at=run_at, status='pending', attempts=0, processed_at=None)
+
+    def __str__(self):
+        return f"{self.homework_id} - {self.event} at {self.run_at}"
+
+    class Meta:
+        unique_together = ['homework', 'event']
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        ordering = ['run_at']
+
+
 class Submission(models.Model):
     homework = models.ForeignKey(Homework, on_delete=models.CASCADE, related_name='submissions')
     student = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -96,8 +280,26 @@ class Submission(models.Model):
     ai_grade = models.FloatField(null=True, blank=True)
     final_grade = models.FloatField(null=True, blank=True)
     ai_feedback = models.TextField(blank=True)
+    version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_final_grade = instance.__dict__.get('final_grade')
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous = getattr(self, '_saved_final_grade', None)
+        super().save(*args, **kwargs)
+        if self.final_grade != previous:
+            from apps.courses import record_grade_change
+            from apps.rollups import record_score_change
+            record_score_change(self.student_id, self.homework.group_id,
+                                (self.final_grade or 0) - (previous or 0))
+            record_grade_change(self.homework, self.student_id, previous, self.final_grade)
+            self._saved_final_grade = self.final_grade
+
     def __str__(self):
         return f"{self.student.fullname} - {self.homework.title}"
 
@@ -113,9 +315,17 @@ class SubmissionFile(models.Model):
     line_count = models.PositiveIntegerField()
 
     def save(self, *args, **kwargs):
-        if self.content:
-            self.line_count = len(self.content.split('\n'))
+        # An empty upload has no lines; its metrics are recomputed too, so none go stale
+        self.line_count = self.content.count('\n') + 1 if self.content else 0
         super().save(*args, **kwargs)
+        from apps.metrics import schedule_metrics
+        pk, content = self.pk, self.content
+        transaction.on_commit(lambda: schedule_metrics(pk, content))
+
+    @property
+    def effective_line_count(self):
+        metrics = getattr(self, 'metrics', None)
+        return metrics.line_count if metrics else self.line_count
 
     def __str__(self):
         return f"{self.file_name} - {self.submission}"
@@ -124,6 +334,42 @@ class SubmissionFile(models.Model):
         ordering = ['file_name']
 
 
+class SubmissionFileVersion(models.Model):
+    KIND_CHOICES = (
+        ('full', 'Full content'),
+        ('diff', 'Diff against previous version'),
+        ('deleted', 'Deleted'),
+    )
+    submission = models.ForeignKey(Submission, on_delete=models.CASCADE, related_name='file_versions')
+    file_name = models.CharField(max_length=255)
+    version = models.PositiveIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    data = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.file_name} v{self.version} ({self.kind})"
+
+    class Meta:
+        unique_together = ['submission', 'file_name', 'version']
+        ordering = ['file_name', 'version']
+
+
+class SubmissionFileMetrics(models.Model):
+    file = models.OneToOneField(SubmissionFile, on_delete=models.CASCADE, related_name='metrics')
+    line_count = models.PositiveIntegerField(default=0)
+    non_blank_lines = models.PositiveIntegerField(default=0)
+    comment_lines = models.PositiveIntegerField(default=0)
+    function_count = models.PositiveIntegerField(default=0)
+    class_count = models.PositiveIntegerField(default=0)
+    cyclomatic_complexity = models.PositiveIntegerField(default=0)
+    parsed_ok = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Metrics for {self.file}"
+
+
 class Grade(models.Model):
     submission = models.OneToOneField(Submission, on_delete=models.CASCADE, related_name='grade')
     ai_task_completeness = models.FloatField(null=True, blank=True)
@@ -140,10 +386,60 @@ class Grade(models.Model):
     correctness_feedback = models.TextField(blank=True)
     modified_by_teacher = models.BooleanField(default=False)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from apps.analytics import invalidate
+        invalidate()
+
     def __str__(self):
         return f"Grade for {self.submission}"
 
 
+class HomeworkTestCase(models.Model):
+    # Run against every submission by apps.sandbox; stdout must match expected_output
+    homework = models.ForeignKey(Homework, on_delete=models.CASCADE, related_name='test_cases')
+    name = models.CharField(max_length=100)
+    stdin = models.TextField(blank=True)
+    expected_output = models.TextField()
+    weight = models.FloatField(default=1)
+    order = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.homework.title} - {self.name}"
+
+    class Meta:
+        ordering = ['order', 'id']
+
+
+class SandboxResult(models.Model):
+    # Test results keyed by the hash of files, test cases and limits
+    content_hash = models.CharField(max_length=64, unique=True)
+    score = models.FloatField()
+    results = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} - {self.score}"
+
+
+class ArchivedSubmission(models.Model):
+    # Submission, its files and grade packed into one zlib-compressed JSON payload
+    original_id = models.BigIntegerField(unique=True)
+    homework = models.ForeignKey(Homework, on_delete=models.CASCADE, related_name='archived_submissions')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_submissions')
+    final_grade = models.FloatField(null=True, blank=True)
+    submitted_at = models.DateTimeField()
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived submission {self.original_id}"
+
+    class Meta:
+        indexes = [models.Index(fields=['student', 'homework'])]
+
+
 class UserSession(Model):
     user = ForeignKey(User, on_delete=CASCADE)
     refresh_token = CharField(max_length=255)
@@ -158,3 +454,93 @@ class UserSession(Model):
     class Meta:
         ordering = ['-created_at']
 
+
+class ScoreSnapshot(models.Model):
+    OWNER_CHOICES = (
+        ('student', 'Student'),
+        ('group', 'Group'),
+    )
+    PERIOD_CHOICES = (
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+    owner_type = models.CharField(max_length=10, choices=OWNER_CHOICES)
+    owner_id = models.BigIntegerField()
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, default='day')
+    period_start = models.DateField()
+    total_score = models.FloatField(default=0)
+    delta = models.FloatField(default=0)
+    changes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner_type} {self.owner_id} - {self.period} {self.period_start}"
+
+    class Meta:
+        unique_together = ['owner_type', 'owner_id', 'period', 'period_start']
+        indexes = [models.Index(fields=['owner_type', 'owner_id', 'period_start'])]
+        ordering = ['period_start']
+
+
+class CourseStanding(models.Model):
+    # Per-student course totals, kept current by apps.courses
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='standings')
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='course_standings')
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total_score = models.FloatField(default=0)
+    submitted = models.IntegerField(default=0)
+    graded = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'student']
+        indexes = [models.Index(fields=['course', '-total_score', 'student'])]
+
+
+class CourseHomeworkStats(models.Model):
+    # One row per homework template of a course: completion across all groups that got it
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='homework_stats')
+    template = models.CharField(max_length=200)
+    homeworks = models.IntegerField(default=0)
+    assigned = models.IntegerField(default=0)
+    submitted = models.IntegerField(default=0)
+    graded = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'template']
+
+
+class CourseGroupStats(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='group_stats')
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='course_stats')
+    students = models.IntegerField(default=0)
+    submitted = models.IntegerField(default=0)
+    graded = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'group']
+
+
+class DeletionJob(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    target_model = models.CharField(max_length=100)
+    target_id = models.BigIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    estimated_rows = models.PositiveIntegerField(default=0)
+    deleted_rows = models.PositiveIntegerField(default=0)
+    current_step = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Delete {self.target_model} {self.target_id} ({self.status})"
+
+    class Meta:
+        ordering = ['created_at']
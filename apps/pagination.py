@@ -0,0 +1,47 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class TypeaheadPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination without the COUNT(*): one extra row tells whether there is a next page.
+    Stays unpaginated unless ?limit= is given, so plain list calls keep their old shape.
+    """
+    max_limit = 200
+    # Used for querysets without an ORDER BY (views may set pagination_ordering); OFFSET needs a total order
+    ordering = ('pk',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        if not queryset.ordered:
+            queryset = queryset.order_by(*getattr(view, 'pagination_ordering', self.ordering))
+        self.request = request
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties'].pop('count', None)
+        response['required'] = ['results']
+        return response
@@ -0,0 +1,232 @@
+import cProfile
+import heapq
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from apps.permission import IsAdmin
+
+PHASES = ('auth', 'permission', 'queryset', 'serialization', 'render')
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('request_profile', default=None)
+
+
+def get_config():
+    config = {'ENABLED': False, 'SAMPLE_RATE': 0.1, 'CPROFILE_TOP_N': 0,
+              'CPROFILE_DIR': os.path.join(settings.BASE_DIR, 'profiles')}
+    config.update(getattr(settings, 'PROFILING', {}))
+    return config
+
+
+class RequestProfile:
+    """
+    Phase times are exclusive: time spent in a nested phase, SQL included, is taken off the
+    enclosing one, so the phases never add up to more than the request total.
+    """
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        # [phase, seconds spent in phases nested inside it] per open phase
+        self.stack = []
+
+    def measure(self, phase, func, *args, **kwargs):
+        start = time.perf_counter()
+        self.stack.append([phase, 0.0])
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _, nested = self.stack.pop()
+            self.phases[phase] += elapsed - nested
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: SQL counts towards the queryset phase wherever it runs
+        self.queries += 1
+        return self.measure('queryset', execute, sql, params, many, context)
+
+    def server_timing(self, total):
+        parts = [f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in self.phases.items()]
+        parts.append(f'db;desc="{self.queries} queries"')
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def timed(phase):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            return profile.measure(phase, func, *args, **kwargs)
+        wrapper.profiling_phase = phase
+        return wrapper
+    return decorator
+
+
+def install_instrumentation():
+    """Wraps the DRF steps once so every view is timed without touching its code."""
+    from rest_framework.response import Response
+    from rest_framework.serializers import ListSerializer, Serializer
+
+    if getattr(APIView.perform_authentication, 'profiling_phase', None):
+        return
+    APIView.perform_authentication = timed('auth')(APIView.perform_authentication)
+    APIView.check_permissions = timed('permission')(APIView.check_permissions)
+    APIView.check_object_permissions = timed('permission')(APIView.check_object_permissions)
+    Serializer.data = property(timed('serialization')(Serializer.data.fget))
+    ListSerializer.data = property(timed('serialization')(ListSerializer.data.fget))
+    Response.rendered_content = property(timed('render')(Response.rendered_content.fget))
+
+
+class LatencyRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.sums = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.phases = defaultdict(float)
+        self.sampled = defaultdict(int)
+
+    def observe(self, view, seconds, profile=None):
+        with self.lock:
+            self.histograms[view][bisect_left(BUCKETS, seconds)] += 1
+            self.sums[view] += seconds
+            if profile is not None:
+                self.sampled[view] += 1
+                self.queries[view] += profile.queries
+                for phase, value in profile.phases.items():
+                    self.phases[(view, phase)] += value
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency per view.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for view, counts in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_sum{{view="{view}"}} {self.sums[view]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{view="{view}"}} {cumulative}')
+            lines += [
+                '# HELP http_request_phase_seconds_total Time spent per phase in sampled requests.',
+                '# TYPE http_request_phase_seconds_total counter',
+            ]
+            for (view, phase), value in sorted(self.phases.items()):
+                lines.append(f'http_request_phase_seconds_total{{view="{view}",phase="{phase}"}} {value:.6f}')
+            lines += [
+                '# HELP http_request_db_queries_total SQL queries issued by sampled requests.',
+                '# TYPE http_request_db_queries_total counter',
+            ]
+            for view, value in sorted(self.queries.items()):
+                lines.append(f'http_request_db_queries_total{{view="{view}"}} {value}')
+            lines += [
+                '# HELP http_requests_sampled_total Requests profiled per view.',
+                '# TYPE http_requests_sampled_total counter',
+            ]
+            for view, value in sorted(self.sampled.items()):
+                lines.append(f'http_requests_sampled_total{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = LatencyRegistry()
+
+
+class SlowestProfiles:
+    """Keeps cProfile dumps of the N slowest sampled requests on disk."""
+
+    def __init__(self, size, directory):
+        self.size = size
+        self.directory = directory
+        self.heap = []
+        self.lock = threading.Lock()
+
+    def offer(self, seconds, view, profiler):
+        with self.lock:
+            if len(self.heap) >= self.size and seconds <= self.heap[0][0]:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{seconds * 1000:09.2f}ms-{view.replace("/", "_")}.prof')
+            profiler.dump_stats(path)
+            heapq.heappush(self.heap, (seconds, path))
+            if len(self.heap) > self.size:
+                _, evicted = heapq.heappop(self.heap)
+                if os.path.exists(evicted):
+                    os.remove(evicted)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        self.enabled = self.config['ENABLED']
+        self.slowest = None
+        if self.enabled:
+            install_instrumentation()
+            if self.config['CPROFILE_TOP_N']:
+                self.slowest = SlowestProfiles(self.config['CPROFILE_TOP_N'], self.config['CPROFILE_DIR'])
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        if random.random() >= self.config['SAMPLE_RATE']:
+            response = self.get_response(request)
+            registry.observe(self.view_name(request), time.perf_counter() - start)
+            return response
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        profiler = cProfile.Profile() if self.slowest else None
+        try:
+            with connection.execute_wrapper(profile):
+                if profiler:
+                    profiler.enable()
+                response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.disable()
+            _current.reset(token)
+
+        total = time.perf_counter() - start
+        view = self.view_name(request)
+        registry.observe(view, total, profile)
+        response['Server-Timing'] = profile.server_timing(total)
+        if profiler:
+            self.slowest.offer(total, view, profiler)
+        return response
+
+    @staticmethod
+    def view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return 'unresolved'
+        return match.view_name or match._func_path
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
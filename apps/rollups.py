@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.models import ScoreSnapshot
+
+
+def bucket_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _apply_delta(owner_type, owner_id, day, delta):
+    lookup = dict(owner_type=owner_type, owner_id=owner_id)
+    with transaction.atomic():
+        updated = ScoreSnapshot.objects.filter(period='day', period_start=day, **lookup).update(
+            total_score=F('total_score') + delta, delta=F('delta') + delta, changes=F('changes') + 1)
+        if updated:
+            return
+        # First write of the day starts from the last known running total
+        previous = (ScoreSnapshot.objects.filter(period_start__lt=day, **lookup)
+                    .order_by('-period_start').values_list('total_score', flat=True).first()) or 0
+        ScoreSnapshot.objects.create(period='day', period_start=day, total_score=previous + delta,
+                                     delta=delta, changes=1, **lookup)
+
+
+def record_score_change(student_id, group_id, delta, day=None):
+    if not delta:
+        return
+    day = day or timezone.localdate()
+    _apply_delta('student', student_id, day, delta)
+    if group_id:
+        _apply_delta('group', group_id, day, delta)
+
+
+def compact(source, target, before):
+    # Only buckets that end before the cutoff are merged, so a bucket is never split
+    cutoff = bucket_start(target, before)
+    rows = (ScoreSnapshot.objects.filter(period=source, period_start__lt=cutoff)
+            .order_by('owner_type', 'owner_id', 'period_start'))
+    buckets = OrderedDict()
+    source_ids = []
+    for row in rows.iterator(chunk_size=2000):
+        key = (row.owner_type, row.owner_id, bucket_start(target, row.period_start))
+        bucket = buckets.setdefault(key, {'total_score': 0, 'delta': 0, 'changes': 0})
+        bucket['total_score'] = row.total_score
+        bucket['delta'] += row.delta
+        bucket['changes'] += row.changes
+        source_ids.append(row.pk)
+
+    if not buckets:
+        return 0
+
+    with transaction.atomic():
+        for (owner_type, owner_id, start), values in buckets.items():
+            snapshot, created = ScoreSnapshot.objects.get_or_create(
+                owner_type=owner_type, owner_id=owner_id, period=target, period_start=start, defaults=values)
+            if not created:
+                snapshot.total_score = values['total_score']
+                snapshot.delta += values['delta']
+                snapshot.changes += values['changes']
+                snapshot.save()
+        for i in range(0, len(source_ids), 500):
+            ScoreSnapshot.objects.filter(pk__in=source_ids[i:i + 500]).delete()
+    return len(source_ids)
+
+
+def trajectory(owner_type, owner_id, date_from=None, date_to=None):
+    qs = ScoreSnapshot.objects.filter(owner_type=owner_type, owner_id=owner_id)
+    if date_from:
+        qs = qs.filter(period_start__gte=date_from)
+    if date_to:
+        qs = qs.filter(period_start__lte=date_to)
+    return qs.order_by('period_start')
@@ -0,0 +1,369 @@
+import ctypes
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from django.conf import settings
+
+from apps.write_queue import queue_result
+
+logger = logging.getLogger(__name__)
+
+CLONE_NEWNET = 0x40000000
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC = 0x1, 0x2, 0x4, 0x8
+MS_REC, MS_PRIVATE = 0x4000, 0x40000
+
+DEFAULT_LIMITS = {'CPU_SECONDS': 2, 'WALL_SECONDS': 5, 'MEMORY_MB': 256, 'OUTPUT_KB': 64}
+MAX_FEEDBACK_CHARS = 300
+
+# Runs inside the child interpreter before the student's entry file. Audit hooks cannot be
+# removed once added, so sockets, new processes, ctypes, C-level file openers (sqlite3, mmap)
+# and files outside the sandbox stay blocked
+BOOTSTRAP = '''
+import os, runpy, sys
+main, allowed = sys.argv[1], tuple(sys.argv[2:])
+DENIED = ('socket.', 'subprocess.', 'os.system', 'os.exec', 'os.posix_spawn', 'os.spawn', 'os.fork',
+          'os.kill', 'os.killpg', 'ctypes.', 'pty.', 'gc.get_', 'sys._current_frames', 'webbrowser.',
+          'sqlite3.', 'mmap.')
+DENIED_MODULES = frozenset(('_ctypes', '_sqlite3', 'mmap', '_posixsubprocess', '_socket'))
+PATH_EVENTS = ('open', 'os.listdir', 'os.scandir', 'os.remove', 'os.rename', 'os.mkdir', 'os.rmdir',
+               'os.chdir', 'os.symlink', 'os.link', 'os.truncate', 'shutil.rmtree', 'os.chmod', 'os.chown',
+               'os.chflags', 'os.utime', 'os.getxattr', 'os.setxattr', 'os.listxattr', 'os.removexattr')
+def hook(event, args, denied=DENIED, denied_modules=DENIED_MODULES, path_events=PATH_EVENTS, allowed=allowed,
+         realpath=os.path.realpath):
+    if event.startswith(denied):
+        raise PermissionError(f'{event} is not allowed')
+    if event == 'import' and args[0] in denied_modules:
+        raise PermissionError(f'importing {args[0]} is not allowed')
+    if event == 'object.__setattr__' and args[1] in ('__code__', '__defaults__', '__kwdefaults__'):
+        raise PermissionError('rebinding function internals is not allowed')
+    if event in path_events and args and isinstance(args[0], (str, bytes)):
+        path = realpath(os.fsdecode(args[0]))
+        if not path.startswith(allowed):
+            raise PermissionError(f'{path} is outside the sandbox')
+sys.addaudithook(hook)
+sys.argv = [main]
+sys.path.insert(0, os.path.dirname(main))
+runpy.run_path(main, run_name='__main__')
+'''
+
+RUNNERS = {
+    '.py': lambda main, workdir: [sys.executable, '-I', '-c', BOOTSTRAP, main, workdir,
+                                  os.path.realpath(sys.base_prefix), os.path.realpath(sys.prefix)],
+}
+
+_executor = None
+_isolated = None
+
+
+class SandboxUnavailable(Exception):
+    pass
+
+
+def _isolate(hidden):
+    """
+    Moves the child into fresh user, network and mount namespaces: only a downed loopback, and
+    an empty read-only tmpfs over each hidden path (the project tree, the database), so files the
+    web user can read stay out of reach even past the audit hook. False where not permitted.
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.unshare(CLONE_NEWUSER | CLONE_NEWNET | CLONE_NEWNS) != 0:
+        return False
+    # Keep the mounts below from propagating back to the host
+    if libc.mount(b'none', b'/', None, MS_REC | MS_PRIVATE, None) != 0:
+        return False
+    flags = MS_RDONLY | MS_NOSUID | MS_NODEV | MS_NOEXEC
+    return all(libc.mount(b'tmpfs', os.fsencode(path), b'tmpfs', flags, b'size=0') == 0 for path in hidden)
+
+
+def _require_isolation(hidden):
+    if not _isolate(hidden):
+        raise OSError(ctypes.get_errno(), 'unshare or mount of the sandbox namespaces is not permitted')
+
+
+def hidden_paths():
+    """
+    Directories the child must not see: the project tree, the database directories and
+    SANDBOX['HIDDEN_PATHS']. Paths holding the interpreter or the temp dir cannot be hidden.
+    """
+    sandbox = getattr(settings, 'SANDBOX', {})
+    paths = [settings.BASE_DIR, *sandbox.get('HIDDEN_PATHS', ())]
+    paths += [os.path.dirname(str(db['NAME'])) for db in settings.DATABASES.values()
+              if db['ENGINE'].endswith('sqlite3') and str(db['NAME']) != ':memory:']
+    needed = [os.path.realpath(p) for p in (sys.prefix, sys.base_prefix, sys.executable, tempfile.gettempdir())]
+    hidden = set()
+    for path in map(os.path.realpath, map(str, paths)):
+        if os.path.isdir(path) and not any(n == path or n.startswith(path + os.sep) for n in needed):
+            hidden.add(path)
+    return sorted(hidden)
+
+
+def probe_isolation(hidden=()):
+    """True when a child process can be put in its own user, network and mount namespaces on this host."""
+    try:
+        subprocess.run([sys.executable, '-c', ''], preexec_fn=lambda: _require_isolation(hidden), check=True,
+                       timeout=10, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return True
+
+
+def check_isolation():
+    """
+    Refuses to run student code when namespace isolation is unavailable: the audit hook alone
+    is not a security boundary. SANDBOX['ALLOW_AUDIT_HOOK_ONLY'] accepts that risk explicitly.
+    """
+    global _isolated
+    allowed = getattr(settings, 'SANDBOX', {}).get('ALLOW_AUDIT_HOOK_ONLY', False)
+    if _isolated is None:
+        # preexec_fn is unsafe in a threaded process, so probe from a single-threaded pool worker
+        _isolated = get_executor().submit(probe_isolation, hidden_paths()).result()
+        if not _isolated and allowed:
+            logger.warning('Sandbox namespaces are not available; sandboxed code is only '
+                           'restricted by the audit hook (SANDBOX ALLOW_AUDIT_HOOK_ONLY is set)')
+    if not _isolated and not allowed:
+        raise SandboxUnavailable('Namespace isolation (unshare) is not permitted on this host; '
+                                 'set SANDBOX ALLOW_AUDIT_HOOK_ONLY to run tests with the audit hook only')
+
+
+def _apply_limits(limits, hidden):
+    cpu = limits['CPU_SECONDS']
+    memory = limits['MEMORY_MB'] * 1024 * 1024
+    output = limits['OUTPUT_KB'] * 1024
+    _isolate(hidden)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (output, output))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _write_files(workdir, files):
+    for name, content in files:
+        path = os.path.normpath(os.path.join(workdir, name.lstrip('/')))
+        if not path.startswith(workdir + os.sep):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+
+
+def _entry_file(files, extension):
+    names = sorted(name for name, _ in files if name.endswith(extension))
+    for name in names:
+        if os.path.basename(name) == 'main' + extension:
+            return name
+    return names[0] if names else None
+
+
+def _same_output(actual, expected):
+    # Trailing spaces and trailing blank lines never fail a test
+    def clean(text):
+        return '\n'.join(line.rstrip() for line in text.replace('\r\n', '\n').split('\n')).rstrip('\n')
+    return clean(actual) == clean(expected)
+
+
+def _run_case(command, workdir, case, limits, hidden):
+    name, stdin, expected, weight = case
+    stdin_path, stdout_path, stderr_path = (os.path.join(workdir, f'.{n}') for n in ('stdin', 'stdout', 'stderr'))
+    with open(stdin_path, 'w', encoding='utf-8') as fh:
+        fh.write(stdin)
+
+    started = time.monotonic()
+    timed_out = False
+    # Output goes to files, not pipes, so RLIMIT_FSIZE caps it and a print loop cannot fill our memory
+    with open(stdin_path, 'rb') as fin, open(stdout_path, 'wb') as fout, open(stderr_path, 'wb') as ferr:
+        proc = subprocess.Popen(command, stdin=fin, stdout=fout, stderr=ferr, cwd=workdir,
+                                env={'PATH': '/usr/bin:/bin', 'HOME': workdir, 'PYTHONIOENCODING': 'utf-8'},
+                                preexec_fn=lambda: _apply_limits(limits, hidden), start_new_session=True)
+        try:
+            proc.wait(timeout=limits['WALL_SECONDS'])
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+    elapsed = round(time.monotonic() - started, 4)
+
+    with open(stdout_path, encoding='utf-8', errors='replace') as fh:
+        stdout = fh.read()
+    with open(stderr_path, encoding='utf-8', errors='replace') as fh:
+        stderr = fh.read()
+
+    result = {'name': name, 'weight': weight, 'time': elapsed, 'passed': False, 'detail': ''}
+    if timed_out:
+        result['status'] = 'timeout'
+        result['detail'] = f"No result within {limits['WALL_SECONDS']}s"
+    elif proc.returncode == -signal.SIGXCPU:
+        result['status'] = 'timeout'
+        result['detail'] = f"CPU limit of {limits['CPU_SECONDS']}s exceeded"
+    elif proc.returncode == -signal.SIGXFSZ:
+        result['status'] = 'error'
+        result['detail'] = f"Output limit of {limits['OUTPUT_KB']}KB exceeded"
+    elif proc.returncode != 0:
+        result['status'] = 'error'
+        result['detail'] = (stderr.strip().splitlines() or [f'Exit code {proc.returncode}'])[-1]
+    elif _same_output(stdout, expected):
+        result['status'] = 'passed'
+        result['passed'] = True
+    else:
+        result['status'] = 'failed'
+        result['detail'] = f'Expected {expected.strip()[:100]!r}, got {stdout.strip()[:100]!r}'
+    return result
+
+
+def run_tests(job, hidden=()):
+    # Pure stdlib like the code metrics, so pool workers never set up Django; hidden comes from hidden_paths()
+    extension = job['extension']
+    runner = RUNNERS.get(extension)
+    if runner is None:
+        return [{'name': name, 'weight': weight, 'time': 0, 'passed': False, 'status': 'error',
+                 'detail': f'Tests cannot be run for {extension} files'} for name, _, _, weight in job['cases']]
+    entry = _entry_file(job['files'], extension)
+    if entry is None:
+        return [{'name': name, 'weight': weight, 'time': 0, 'passed': False, 'status': 'error',
+                 'detail': f'No {extension} file submitted'} for name, _, _, weight in job['cases']]
+
+    workdir = os.path.realpath(tempfile.mkdtemp(prefix='sandbox-'))
+    try:
+        os.chmod(workdir, 0o700)
+        _write_files(workdir, job['files'])
+        command = runner(os.path.join(workdir, entry.lstrip('/')), workdir)
+        return [_run_case(command, workdir, case, job['limits'], hidden) for case in job['cases']]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def summarize(results):
+    """Weighted pass rate as a percentage, and feedback listing the cases that did not pass."""
+    total = sum(r['weight'] for r in results)
+    passed = sum(r['weight'] for r in results if r['passed'])
+    score = round(100 * passed / total, 2) if total else 0.0
+    lines = [f"{sum(r['passed'] for r in results)}/{len(results)} tests passed"]
+    for r in results:
+        if not r['passed']:
+            lines.append(f"{r['name']}: {r['status']} - {r['detail'][:MAX_FEEDBACK_CHARS]}")
+    return score, '\n'.join(lines)
+
+
+def get_limits():
+    return {**DEFAULT_LIMITS, **getattr(settings, 'SANDBOX', {}).get('LIMITS', {})}
+
+
+def _init_worker():
+    # Workers are spawned, not forked, so they hold no Django state; drop the environment too
+    os.environ.clear()
+    os.environ['PATH'] = '/usr/bin:/bin'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'SANDBOX', {}).get('WORKERS') or os.cpu_count()
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+    return _executor
+
+
+def warm_up():
+    """Starts every pool worker now, so the first batch does not pay for interpreter start-up."""
+    executor = get_executor()
+    wait([executor.submit(os.getpid) for _ in range(executor._max_workers)])
+
+
+def build_job(submission, cases):
+    return {
+        'extension': submission.homework.file_extension,
+        'files': sorted((f.file_name, f.content) for f in submission.files.all()),
+        'cases': [(c.name, c.stdin, c.expected_output, c.weight) for c in cases],
+        'limits': get_limits(),
+    }
+
+
+def content_hash(job):
+    # Same files, tests and limits give the same result, so identical submissions run once
+    return hashlib.sha256(json.dumps(job, sort_keys=True).encode()).hexdigest()
+
+
+def store_results(digest, submission_ids, results):
+    from apps.analytics import invalidate
+    from apps.models import Grade, SandboxResult
+
+    score, feedback = summarize(results)
+    SandboxResult.objects.bulk_create([SandboxResult(content_hash=digest, score=score, results=results)],
+                                      ignore_conflicts=True)
+    grades = {g.submission_id: g for g in Grade.objects.filter(submission_id__in=submission_ids)}
+    for grade in grades.values():
+        grade.ai_correctness, grade.correctness_feedback = score, feedback
+    Grade.objects.bulk_update(grades.values(), ['ai_correctness', 'correctness_feedback'])
+    Grade.objects.bulk_create([Grade(submission_id=pk, ai_correctness=score, correctness_feedback=feedback)
+                               for pk in submission_ids if pk not in grades])
+    invalidate()
+
+
+def run_homework_tests(homework, submissions=None, wait_for_results=False):
+    """
+    Runs the homework's test cases against its submissions (all of them by default).
+    Cached hashes are written at once and the rest go to the pool. With wait_for_results
+    the call blocks and the returned stats include throughput.
+    """
+    from apps.models import SandboxResult, Submission
+
+    cases = list(homework.test_cases.all())
+    if not cases:
+        return {'submissions': 0, 'unique': 0, 'cached': 0, 'executed': 0}
+    if submissions is None:
+        submissions = Submission.objects.filter(homework=homework)
+    submissions = submissions.select_related('homework').prefetch_related('files')
+
+    by_hash = {}
+    jobs = {}
+    for submission in submissions:
+        job = build_job(submission, cases)
+        digest = content_hash(job)
+        by_hash.setdefault(digest, []).append(submission.pk)
+        jobs[digest] = job
+
+    cached = SandboxResult.objects.filter(content_hash__in=list(by_hash)).values_list('content_hash', 'results')
+    hits = 0
+    for digest, results in cached:
+        store_results(digest, by_hash.pop(digest), results)
+        hits += 1
+
+    if by_hash:
+        check_isolation()
+    hidden = hidden_paths()
+    started = time.monotonic()
+    futures = []
+    for digest, submission_ids in by_hash.items():
+        future = get_executor().submit(run_tests, jobs[digest], hidden)
+        if wait_for_results:
+            futures.append((future, digest, submission_ids))
+        else:
+            future.add_done_callback(queue_result(store_results, digest, submission_ids))
+
+    stats = {'submissions': len(submissions), 'unique': len(jobs), 'cached': hits, 'executed': len(by_hash)}
+    if futures:
+        for future, digest, submission_ids in futures:
+            store_results(digest, submission_ids, future.result())
+        elapsed = time.monotonic() - started
+        runs = len(by_hash) * len(cases)
+        stats.update({
+            'seconds': round(elapsed, 3),
+            'test_runs': runs,
+            'runs_per_second': round(runs / elapsed, 1) if elapsed else None,
+            'submissions_per_second': round(len(by_hash) / elapsed, 1) if elapsed else None,
+        })
+    return stats
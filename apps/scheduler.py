@@ -0,0 +1,112 @@
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from apps.models import Homework, HomeworkJob
+
+logger = logging.getLogger(__name__)
+
+# Receivers get homework_ids: every homework that reached the event in the same tick
+homework_started = Signal()
+homework_closed = Signal()
+
+EVENT_SIGNALS = {
+    'start': homework_started,
+    'deadline': homework_closed,
+}
+# event -> (status it may move from, status it moves to)
+EVENT_STATUS = {
+    'start': (['scheduled'], 'open'),
+    'deadline': (['scheduled', 'open'], 'closed'),
+}
+
+
+class HomeworkScheduler:
+    def __init__(self, tick=1.0, horizon=timedelta(minutes=5), max_attempts=3):
+        self.tick = tick
+        self.horizon = horizon
+        self.max_attempts = max_attempts
+        self.heap = []
+        self.queued = set()
+        self.next_load = None
+
+    def load(self, now):
+        # Missed events after a restart are simply pending jobs with run_at in the past
+        jobs = (HomeworkJob.objects
+                .filter(status='pending', run_at__lte=now + self.horizon)
+                .exclude(pk__in=self.queued)
+                .values_list('run_at', 'pk', 'event', 'homework_id'))
+        for job in jobs:
+            heapq.heappush(self.heap, job)
+            self.queued.add(job[1])
+        self.next_load = now + self.horizon / 2
+
+    def pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            job = heapq.heappop(self.heap)
+            self.queued.discard(job[1])
+            due.append(job)
+        return due
+
+    def fire(self, due, now=None):
+        now = now or timezone.now()
+        batches = defaultdict(list)
+        for run_at, pk, event, homework_id in due:
+            batches[event].append(pk)
+
+        fired = 0
+        for event, job_ids in batches.items():
+            try:
+                with transaction.atomic():
+                    # A job rescheduled after it was loaded still has its old heap entry; skip it
+                    jobs = dict(HomeworkJob.objects.select_for_update()
+                                .filter(pk__in=job_ids, status='pending', run_at__lte=now)
+                                .values_list('pk', 'homework_id'))
+                    if len(jobs) < len(job_ids):
+                        # Pick up the new run_at on the next tick instead of after half a horizon
+                        self.next_load = now
+                    if not jobs:
+                        continue
+                    homework_ids = list(jobs.values())
+                    from_statuses, to_status = EVENT_STATUS[event]
+                    Homework.objects.filter(pk__in=homework_ids, status__in=from_statuses).update(status=to_status)
+                    HomeworkJob.objects.filter(pk__in=list(jobs)).update(
+                        status='done', attempts=F('attempts') + 1, processed_at=now)
+            except Exception as exc:
+                logger.exception('Homework %s jobs failed', event)
+                HomeworkJob.objects.filter(pk__in=job_ids).update(
+                    attempts=F('attempts') + 1, last_error=str(exc))
+                HomeworkJob.objects.filter(pk__in=job_ids, attempts__gte=self.max_attempts).update(status='failed')
+                continue
+
+            fired += len(homework_ids)
+            for receiver, result in EVENT_SIGNALS[event].send_robust(sender=self.__class__,
+                                                                     homework_ids=homework_ids):
+                if isinstance(result, Exception):
+                    logger.error('Receiver %s failed on %s: %s', receiver, event, result)
+        return fired
+
+    def run_once(self, now=None):
+        now = now or timezone.now()
+        if self.next_load is None or now >= self.next_load:
+            self.load(now)
+        return self.fire(self.pop_due(now), now)
+
+    def seconds_until_next(self, now):
+        wake = self.next_load
+        if self.heap:
+            wake = min(wake, self.heap[0][0])
+        return max(0.0, min(self.tick, (wake - now).total_seconds()))
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+            time.sleep(self.seconds_until_next(timezone.now()))
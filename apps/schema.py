@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+
+
+class SchemaArtifact:
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.compressed = None
+        self.etag = None
+        self._raw = None
+
+    def load(self):
+        """Returns self when the artifact exists, rereading it only after a rebuild."""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        if mtime != self.mtime:
+            with open(self.path, 'rb') as f:
+                self.compressed = f.read()
+            self.etag = hashlib.sha256(self.compressed).hexdigest()[:16]
+            self._raw = None
+            self.mtime = mtime
+        return self
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = gzip.decompress(self.compressed)
+        return self._raw
+
+
+artifact = SchemaArtifact(settings.SPECTACULAR_SCHEMA_PATH)
+
+
+def build_schema(path=settings.SPECTACULAR_SCHEMA_PATH):
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    content = OpenApiJsonRenderer().render(schema, renderer_context={})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # mtime=0 keeps the bytes (and so the ETag) identical across identical builds
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    os.replace(tmp_path, path)
+    return len(content)
+
+
+def _versioned_url():
+    current = artifact.load()
+    if current is None:
+        return None
+    return reverse('schema-versioned', kwargs={'version': current.etag})
+
+
+class CachedSchemaAPIView(SpectacularAPIView):
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        current = artifact.load()
+        if current is None:
+            if settings.DEBUG:
+                return super().get(request, *args, **kwargs)
+            return JsonResponse({"error": "Schema is not built, run manage.py build_schema"}, status=503)
+
+        etag = f'"{current.etag}"'
+        cache_control = IMMUTABLE if kwargs.get('version') == current.etag else REVALIDATE
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=304)
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(current.compressed, content_type='application/vnd.oai.openapi+json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(current.raw, content_type='application/vnd.oai.openapi+json')
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class CachedSwaggerView(SpectacularSwaggerView):
+    def _get_schema_url(self, request):
+        return _versioned_url() or super()._get_schema_url(request)
+
+
+class CachedRedocView(SpectacularRedocView):
+    def _get_schema_url(self, request):
+        return _versioned_url() or super()._get_schema_url(request)
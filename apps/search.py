@@ -0,0 +1,62 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+SEARCH_FIELDS = ('search_fullname', 'search_username', 'search_phone')
+# Largest code point: any string starting with the prefix sorts below prefix + this
+PREFIX_END = '\U0010ffff'
+TRIGRAM_MIN_LENGTH = 3
+PHONE_TERM = re.compile(r'[\d\s()+-]+')
+
+
+def normalize_text(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    return ' '.join(value.lower().split())
+
+
+def normalize_phone(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def prefix_q(field, term):
+    if connection.vendor == 'postgresql':
+        # LIKE 'term%' is served by the text_pattern_ops indexes created in create_search_indexes
+        return Q(**{f'{field}__startswith': term})
+    # A plain range works with the btree indexes in User.Meta on any collation-free backend
+    return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_END})
+
+
+def directory_q(term):
+    text = normalize_text(term)
+    if not text:
+        return Q()
+    query = prefix_q('search_fullname', text) | prefix_q('search_username', text)
+    phone = normalize_phone(term)
+    if phone and PHONE_TERM.fullmatch(term):
+        query |= prefix_q('search_phone', phone)
+    if connection.vendor == 'postgresql' and len(text) >= TRIGRAM_MIN_LENGTH:
+        # Substring matches (e.g. a surname in the middle) use the trigram GIN indexes
+        query |= Q(search_fullname__contains=text) | Q(search_username__contains=text)
+    return query
+
+
+def create_search_indexes(sender, using='default', **kwargs):
+    """post_migrate hook: PostgreSQL-only pattern and trigram indexes that Meta.indexes cannot express portably."""
+    from django.db import connections
+    from apps.models import User
+
+    conn = connections[using]
+    if conn.vendor != 'postgresql':
+        return
+    table = User._meta.db_table
+    with conn.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for field in SEARCH_FIELDS:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_{field}_prefix '
+                           f'ON {table} (role, {field} text_pattern_ops)')
+        for field in ('search_fullname', 'search_username'):
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_{field}_trgm '
+                           f'ON {table} USING gin ({field} gin_trgm_ops)')
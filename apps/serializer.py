@@ -1,8 +1,16 @@
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from rest_framework.serializers import ModelSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenObtainSerializer, \
+    TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth.models import update_last_login
 
-from .models import User, Session, Group, Homework, Submission, SubmissionFile, Grade, Course
+from .models import User, Session, Group, Homework, Submission, SubmissionFile, Grade, Course, SubmissionFileMetrics, \
+    ScoreSnapshot, DeletionJob, HomeworkTestCase, CourseStanding, CourseHomeworkStats, CourseGroupStats
+from .tokens import stamp_claims
+from .versioning import submit
 
 
 class RegisterSerializer(ModelSerializer):
@@ -98,11 +106,12 @@ class StudentSerializer(serializers.ModelSerializer):
 
 class GroupSerializer(serializers.ModelSerializer):
     teacher_name = serializers.SerializerMethodField()
+    course_name = serializers.SerializerMethodField()
     student_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Group
-        fields = ['id', 'name', 'teacher', 'teacher_name', 'student_count', 'created_at']
+        fields = ['id', 'name', 'teacher', 'teacher_name', 'course', 'course_name', 'student_count', 'created_at']
         read_only_fields = ['student_count']
 
     def get_teacher_name(self, obj):
@@ -133,8 +142,8 @@ class HomeworkSerializer(serializers.ModelSerializer):
         model = Homework
         fields = ['id', 'title', 'description', 'points', 'start_date', 'deadline',
                   'line_limit', 'teacher', 'teacher_name', 'group', 'group_name',
-                  'file_extension', 'ai_grading_prompt', 'submission_count', 'is_submitted', 'created_at']
-        read_only_fields = ['teacher', 'submission_count', 'is_submitted']
+                  'file_extension', 'ai_grading_prompt', 'template', 'status', 'submission_count', 'is_submitted', 'created_at']
+        read_only_fields = ['teacher', 'status', 'submission_count', 'is_submitted']
 
     def get_teacher_name(self, obj):
         return obj.teacher.fullname
@@ -152,10 +161,31 @@ class HomeworkSerializer(serializers.ModelSerializer):
         return False
 
 
+class HomeworkTestCaseSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HomeworkTestCase
+        fields = ['id', 'name', 'stdin', 'expected_output', 'weight', 'order', 'created_at']
+        read_only_fields = ['created_at']
+
+
+class SubmissionFileMetricsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubmissionFileMetrics
+        fields = ['line_count', 'non_blank_lines', 'comment_lines', 'function_count',
+                  'class_count', 'cyclomatic_complexity', 'parsed_ok', 'computed_at']
+
+
 class SubmissionFileSerializer(serializers.ModelSerializer):
+    metrics = SubmissionFileMetricsSerializer(read_only=True)
+    exceeds_line_limit = serializers.SerializerMethodField()
+
     class Meta:
         model = SubmissionFile
-        fields = ['id', 'file_name', 'content', 'line_count']
+        fields = ['id', 'file_name', 'content', 'line_count', 'metrics', 'exceeds_line_limit']
+
+    def get_exceeds_line_limit(self, obj):
+        line_limit = obj.submission.homework.line_limit
+        return bool(line_limit) and obj.effective_line_count > line_limit
 
 
 class GradeSerializer(serializers.ModelSerializer):
@@ -165,18 +195,34 @@ class GradeSerializer(serializers.ModelSerializer):
         read_only_fields = ['submission']
 
 
+class SubmissionFileUploadSerializer(serializers.Serializer):
+    file_name = serializers.CharField(max_length=255)
+    content = serializers.CharField(allow_blank=True, trim_whitespace=False)
+
+
 class SubmissionSerializer(serializers.ModelSerializer):
     student_name = serializers.SerializerMethodField()
     homework_title = serializers.SerializerMethodField()
     files = SubmissionFileSerializer(many=True, read_only=True)
+    upload = SubmissionFileUploadSerializer(many=True, write_only=True, required=False)
     grade = GradeSerializer(read_only=True)
 
     class Meta:
         model = Submission
         fields = ['id', 'homework', 'homework_title', 'student', 'student_name',
-                  'submitted_at', 'ai_grade', 'final_grade', 'ai_feedback',
-                  'files', 'grade', 'created_at']
-        read_only_fields = ['student', 'submitted_at', 'ai_grade', 'ai_feedback', 'created_at']
+                  'submitted_at', 'ai_grade', 'final_grade', 'ai_feedback', 'version',
+                  'files', 'upload', 'grade', 'created_at']
+        read_only_fields = ['student', 'submitted_at', 'ai_grade', 'ai_feedback', 'version', 'created_at']
+        validators = []
+
+    def create(self, validated_data):
+        # A second submission for the same homework becomes a new version
+        return submit(validated_data['homework'], validated_data['student'], validated_data.get('upload'))
+
+    def validate_homework(self, homework):
+        if not homework.accepts_submissions:
+            raise serializers.ValidationError("Homework is not accepting submissions")
+        return homework
 
     def get_student_name(self, obj):
         return obj.student.fullname
@@ -201,12 +247,115 @@ class UserSerializer(serializers.ModelSerializer):
 
 class CreateHomeworkSerializer(ModelSerializer):
     student_name = SerializerMethodField()
+    upload = SubmissionFileUploadSerializer(many=True, write_only=True, required=False)
+
     class Meta:
         model = Submission
         fields = (
             'homework', 'student',
-            'ai_grade', 'ai_feedback', 'student_name'
+            'ai_grade', 'ai_feedback', 'student_name', 'upload'
         )
+        read_only_fields = ('student',)
+        # submit() turns a repeated (homework, student) into a new version
+        validators = []
+
+    def validate_homework(self, homework):
+        if not homework.accepts_submissions:
+            raise serializers.ValidationError("Homework is not accepting submissions")
+        return homework
+
+    def create(self, validated_data):
+        submission = submit(validated_data.pop('homework'), validated_data.pop('student'),
+                            validated_data.pop('upload', None))
+        if validated_data:
+            for attr, value in validated_data.items():
+                setattr(submission, attr, value)
+            submission.save()
+        return submission
 
     def get_student_name(self, obj):
-        return obj.student.full_name
+        return obj.student.fullname
+
+
+class ScoreSnapshotSerializer(ModelSerializer):
+    class Meta:
+        model = ScoreSnapshot
+        fields = ('period', 'period_start', 'total_score', 'delta', 'changes')
+
+
+class CourseSerializer(ModelSerializer):
+    class Meta:
+        model = Course
+        fields = ('id', 'name')
+
+
+def _ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+class CourseStandingSerializer(ModelSerializer):
+    rank = serializers.IntegerField(read_only=True)
+    fullname = serializers.CharField(source='student.fullname', read_only=True)
+    group_name = serializers.CharField(source='group.name', read_only=True, default=None)
+
+    class Meta:
+        model = CourseStanding
+        fields = ('rank', 'student', 'fullname', 'group', 'group_name', 'total_score', 'submitted', 'graded')
+
+
+class CourseHomeworkStatsSerializer(ModelSerializer):
+    completion_rate = SerializerMethodField()
+    average_score = SerializerMethodField()
+
+    class Meta:
+        model = CourseHomeworkStats
+        fields = ('template', 'homeworks', 'assigned', 'submitted', 'graded', 'completion_rate', 'average_score')
+
+    def get_completion_rate(self, obj):
+        return _ratio(obj.submitted, obj.assigned)
+
+    def get_average_score(self, obj):
+        return _ratio(obj.score_sum, obj.graded)
+
+
+class CourseGroupStatsSerializer(ModelSerializer):
+    group_name = serializers.CharField(source='group.name', read_only=True)
+    average_score = SerializerMethodField()
+
+    class Meta:
+        model = CourseGroupStats
+        fields = ('group', 'group_name', 'students', 'submitted', 'graded', 'average_score')
+
+    def get_average_score(self, obj):
+        return _ratio(obj.score_sum, obj.graded)
+
+
+class DeletionJobSerializer(ModelSerializer):
+    class Meta:
+        model = DeletionJob
+        fields = ('id', 'target_model', 'target_id', 'status', 'estimated_rows', 'deleted_rows',
+                  'current_step', 'last_error', 'created_at', 'updated_at')
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Claims go on the access token only; the refresh token is stored in UserSession and stays small
+
+    def validate(self, attrs):
+        data = TokenObtainSerializer.validate(self, attrs)
+        refresh = self.get_token(self.user)
+        data['refresh'] = str(refresh)
+        data['access'] = str(stamp_claims(refresh.access_token, self.user))
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        # Claims are read fresh here, which is how a role or group change reaches the client
+        access = AccessToken(data['access'], verify=False)
+        user = User.objects.only('id', 'role', 'group_id', 'token_version').get(pk=access[api_settings.USER_ID_CLAIM])
+        data['access'] = str(stamp_claims(access, user))
+        return data
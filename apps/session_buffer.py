@@ -0,0 +1,144 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from apps.write_queue import get_write_queue
+
+logger = logging.getLogger(__name__)
+
+# Far longer than a row waits in any worker's buffer, after which it is in the table anyway
+PENDING_TIMEOUT = 60
+PENDING_FIELDS = ('user_id', 'refresh_token', 'jti', 'user_agent', 'ip_address')
+_pending_lock = threading.Lock()
+
+
+class WriteBehindBuffer:
+    """
+    Collects model instances in memory and writes them with bulk_create from a
+    background thread once max_size rows are waiting or every interval seconds.
+    The buffer is per process: other workers see the rows only once they are
+    flushed, up to interval seconds later, unless they are published elsewhere
+    too (record_session puts them in the shared cache).
+    """
+
+    def __init__(self, model, max_size=100, interval=2.0):
+        self.model = model
+        self.max_size = max_size
+        self.interval = interval
+        self.rows = []
+        # Written but not committed yet (the write queue commits after flush returns)
+        self.in_flight = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=f'{self.model.__name__}-buffer', daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+
+    def add(self, obj):
+        self.start()
+        with self.lock:
+            self.rows.append(obj)
+            full = len(self.rows) >= self.max_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """
+        Writes the buffered rows. Rows still in flight are written again (duplicates are
+        ignored), so a rolled back write is retried and a caller outside any transaction
+        sees them committed when this returns.
+        """
+        with self.lock:
+            rows = self.in_flight + self.rows
+            self.in_flight, self.rows = rows, []
+        if not rows:
+            return 0
+        try:
+            self.model.objects.bulk_create(rows, ignore_conflicts=True)
+        except Exception:
+            logger.exception('Flushing %s rows of %s failed', len(rows), self.model.__name__)
+            with self.lock:
+                self.rows[:0] = rows
+                self.in_flight = []
+            return 0
+        transaction.on_commit(lambda: self._committed(rows))
+        return len(rows)
+
+    def _committed(self, rows):
+        with self.lock:
+            if self.in_flight is rows:
+                self.in_flight = []
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            # Written by the process-wide writer thread so it never races other background writes
+            get_write_queue().submit(self.flush)
+            # The flusher thread owns its connection; do not keep it open between flushes
+            connection.close()
+
+
+_buffer = None
+
+
+def get_session_buffer():
+    global _buffer
+    if _buffer is None:
+        from apps.models import UserSession
+        _buffer = WriteBehindBuffer(UserSession,
+                                    max_size=getattr(settings, 'SESSION_BUFFER_SIZE', 100),
+                                    interval=getattr(settings, 'SESSION_BUFFER_INTERVAL', 2.0))
+    return _buffer
+
+
+def _pending_key(user_id):
+    return f'sessions:pending:{user_id}'
+
+
+def record_session(request, user, refresh):
+    from apps.models import UserSession
+    session = UserSession(
+        user_id=user.pk,
+        refresh_token=str(refresh),
+        jti=refresh['jti'],
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        ip_address=request.META.get('REMOTE_ADDR') or None,
+    )
+    get_session_buffer().add(session)
+    # The buffer is private to this worker; the shared cache lets whichever worker serves the
+    # user's next read write the row itself. The lock orders this worker's threads only: if two
+    # workers log the same user in at the same instant, one entry can be lost, and that row then
+    # shows up when its buffer flushes
+    with _pending_lock:
+        pending = cache.get(_pending_key(user.pk), {})
+        pending[session.jti] = {field: getattr(session, field) for field in PENDING_FIELDS}
+        cache.set(_pending_key(user.pk), pending, PENDING_TIMEOUT)
+
+
+def write_pending_sessions(user_id):
+    """
+    Writes the user's sessions that any worker still holds in its buffer. The unique jti makes
+    rows already flushed no-ops, so reads after this see every login that has returned.
+    """
+    from apps.models import UserSession
+    pending = cache.get(_pending_key(user_id))
+    if pending:
+        UserSession.objects.bulk_create([UserSession(**fields) for fields in pending.values()],
+                                        ignore_conflicts=True)
+
+
+def discard_pending_session(user_id, jti):
+    # A revoked session must not be written back by the next read
+    with _pending_lock:
+        pending = cache.get(_pending_key(user_id), {})
+        if pending.pop(jti, None) is not None:
+            cache.set(_pending_key(user_id), pending, PENDING_TIMEOUT)
@@ -0,0 +1,264 @@
+import base64
+import contextlib
+import datetime
+import decimal
+import gzip
+import json
+import os
+import uuid
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+SNAPSHOT_VERSION = 1
+MANIFEST = 'manifest.json'
+# Secrets and in-flight jobs do not belong in a copy of the data
+SKIPPED_MODELS = {'apps.session', 'apps.usersession', 'apps.deletionjob'}
+# Stored as JSON strings and turned back into Python values with Field.to_python on import
+CONVERTED_FIELDS = (models.DateTimeField, models.DateField, models.TimeField, models.DecimalField,
+                    models.UUIDField, models.BinaryField, models.DurationField)
+
+
+def _encode(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    raise TypeError(f'Cannot encode {type(value).__name__}')
+
+
+def snapshot_models(labels=None):
+    """Concrete models of the app (and their m2m tables) in foreign-key order, parents first."""
+    candidates = [m for m in apps.get_app_config('apps').get_models(include_auto_created=True)
+                  if not m._meta.proxy and m._meta.label_lower not in SKIPPED_MODELS]
+    if labels:
+        candidates = [m for m in candidates if m._meta.label_lower in labels]
+    included = set(candidates)
+    # m2m tables to models outside the snapshot (auth groups, permissions) would only dangle
+    candidates = [m for m in candidates if not m._meta.auto_created or all(
+        f.related_model in included for f in m._meta.concrete_fields if f.is_relation)]
+
+    ordered, seen = [], set()
+
+    def visit(model, path):
+        if model in seen or model in path:
+            return
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model in included and field.related_model is not model:
+                visit(field.related_model, path | {model})
+        seen.add(model)
+        ordered.append(model)
+
+    for model in candidates:
+        visit(model, frozenset())
+    return ordered
+
+
+def _file_name(model):
+    return f'{model._meta.label_lower}.ndjson.gz'
+
+
+def pseudonymize_user(row):
+    """
+    Replaces personal fields with values derived from the primary key and the password hash with
+    an unusable one; works on a dict of attnames.
+    """
+    from django.contrib.auth.hashers import make_password
+    from apps.search import normalize_phone, normalize_text
+
+    pk = row['id']
+    role = row.get('role') or 'user'
+    row['fullname'] = f'{role.title()} {pk}'
+    row['username'] = f'{role}{pk}'
+    row['first_name'] = row['last_name'] = ''
+    if row.get('email'):
+        row['email'] = f'{role}{pk}@example.com'
+    if row.get('phone'):
+        row['phone'] = f'+99890{pk % 10000000:07d}'
+    if 'password' in row:
+        # A real hash can be cracked offline; import_snapshot --password sets a usable one
+        row['password'] = make_password(None)
+    # bulk_create skips User.save(), so keep the search columns in step here
+    row['search_fullname'] = normalize_text(row['fullname'])
+    row['search_username'] = normalize_text(row['username'])
+    row['search_phone'] = normalize_phone(row['phone'])
+    return row
+
+
+def _transform(model, pseudonymize):
+    from apps.models import User
+    if pseudonymize and model is User:
+        return pseudonymize_user
+    return None
+
+
+def _export_table(model, path, chunk_size, transform, compresslevel):
+    fields = [f.attname for f in model._meta.concrete_fields]
+    pk_name = model._meta.pk.attname
+    pk_index = fields.index(pk_name)
+    rows = 0
+    last_pk = None
+    with gzip.open(os.path.join(path, _file_name(model)), 'wt', encoding='utf-8', compresslevel=compresslevel) as fh:
+        while True:
+            queryset = model._base_manager.order_by(pk_name)
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            chunk = list(queryset.values_list(*fields)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1][pk_index]
+            lines = []
+            for values in chunk:
+                if transform:
+                    values = [*transform(dict(zip(fields, values))).values()]
+                lines.append(json.dumps(values, default=_encode, ensure_ascii=False, separators=(',', ':')))
+            fh.write('\n'.join(lines) + '\n')
+            rows += len(chunk)
+    return {'model': model._meta.label_lower, 'file': _file_name(model), 'fields': fields, 'rows': rows}
+
+
+@contextlib.contextmanager
+def _consistent_read():
+    """
+    Reads every table from one snapshot, so rows written during the export cannot leave children
+    pointing at parents that were read before them.
+    """
+    if connection.in_atomic_block:
+        # The caller's transaction already pins the snapshot
+        yield
+    elif connection.vendor == 'sqlite':
+        # atomic() would BEGIN IMMEDIATE (DATABASES transaction_mode) and hold the write lock for the
+        # whole export; a deferred transaction only reads, and under WAL writers carry on meanwhile
+        with connection.cursor() as cursor:
+            cursor.execute('BEGIN DEFERRED')
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('COMMIT')
+    else:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            yield
+
+
+def export_snapshot(path, labels=None, chunk_size=5000, pseudonymize=False, compresslevel=1, progress=None):
+    """
+    Streams each table in primary-key chunks to path/<label>.ndjson.gz, one JSON array per row
+    in the column order recorded in the manifest. Memory stays at one chunk per table, and all
+    tables come from one read transaction.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = {'version': SNAPSHOT_VERSION, 'created_at': timezone.now().isoformat(),
+                'pseudonymized': pseudonymize, 'tables': []}
+    with _consistent_read():
+        for model in snapshot_models(labels):
+            manifest['tables'].append(_export_table(model, path, chunk_size, _transform(model, pseudonymize),
+                                                    compresslevel))
+            if progress:
+                progress(model._meta.label_lower, manifest['tables'][-1]['rows'])
+
+    with open(os.path.join(path, MANIFEST), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest.get('version')}")
+    return manifest
+
+
+def _load_table(model, path, table, chunk_size, transform, password_hash):
+    field_map = {f.attname: f for f in model._meta.concrete_fields}
+    unknown = set(table['fields']) - set(field_map)
+    if unknown:
+        raise ValueError(f"{table['model']} has columns this schema does not know: {', '.join(sorted(unknown))}")
+    # Columns added since the export fall back to the model defaults
+    fields = table['fields']
+    converters = [(i, field_map[name].to_python) for i, name in enumerate(fields)
+                  if isinstance(field_map[name], CONVERTED_FIELDS)]
+
+    loaded = 0
+    batch = []
+    with gzip.open(os.path.join(path, table['file']), 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            values = json.loads(line)
+            for i, to_python in converters:
+                if values[i] is not None:
+                    values[i] = to_python(values[i])
+            row = dict(zip(fields, values))
+            if transform:
+                row = transform(row)
+            if password_hash is not None:
+                row['password'] = password_hash
+            batch.append(model(**row))
+            if len(batch) >= chunk_size:
+                model._base_manager.bulk_create(batch)
+                loaded += len(batch)
+                batch = []
+    if batch:
+        model._base_manager.bulk_create(batch)
+        loaded += len(batch)
+    return loaded
+
+
+@contextlib.contextmanager
+def _keep_timestamps(model_list):
+    # bulk_create runs pre_save, which would stamp auto_now(_add) fields with the import time
+    fields = [f for model in model_list for f in model._meta.concrete_fields
+              if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def import_snapshot(path, chunk_size=5000, pseudonymize=False, password=None, replace=False, progress=None):
+    """
+    Loads a snapshot with bulk_create in one transaction. Foreign keys are checked once at the
+    end (Django creates them deferrable), then sequences are moved past the imported ids.
+    save() overrides do not run, so no metrics, test runs or scheduler rows are triggered.
+    """
+    from django.contrib.auth.hashers import make_password
+    from apps.models import User
+
+    manifest = read_manifest(path)
+    tables = [(apps.get_model(t['model']), t) for t in manifest['tables']]
+    password_hash = make_password(password) if password else None
+    loaded = {}
+    with transaction.atomic(), _keep_timestamps([model for model, _ in tables]):
+        with connection.constraint_checks_disabled():
+            if replace:
+                for model, _ in reversed(tables):
+                    model._base_manager.all()._raw_delete(connection.alias)
+            else:
+                not_empty = [t['model'] for model, t in tables if model._base_manager.exists()]
+                if not_empty:
+                    raise ValueError(f"Tables already hold data: {', '.join(not_empty)}")
+            for model, table in tables:
+                loaded[table['model']] = _load_table(model, path, table, chunk_size,
+                                                     _transform(model, pseudonymize),
+                                                     password_hash if model is User else None)
+                if progress:
+                    progress(table['model'], loaded[table['model']])
+        connection.check_constraints(table_names=[model._meta.db_table for model, _ in tables])
+        statements = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in tables])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    return loaded
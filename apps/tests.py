@@ -1 +1,523 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.courses import refresh_course
+from apps.deletion import schedule_deletion
+from apps.profiling import RequestProfile, _current, timed
+from apps.models import (Course, CourseGroupStats, CourseHomeworkStats, CourseStanding, Group, Homework,
+                         HomeworkTestCase, ScoreSnapshot, Submission, User, UserSession)
+from apps.rollups import compact, record_score_change, trajectory
+from apps.session_buffer import WriteBehindBuffer
+from apps.snapshot import export_snapshot
+from apps.sandbox import SandboxUnavailable, get_limits, hidden_paths, probe_isolation, run_tests
+from apps.scheduler import HomeworkScheduler
+from apps.versioning import KEYFRAME_INTERVAL, apply_delta, make_delta, reconstruct, submit
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TIGHT_RATES = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+    'login': '3/min', 'login_ip': '2/min', 'submission': '3/min', 'submission_user': '2/min',
+}}
+
+
+def make_homework(group, title='Loops', teacher=None):
+    now = timezone.now()
+    return Homework.objects.create(title=title, description='', points=10, teacher=teacher or group.teacher,
+                                   group=group, start_date=now - timedelta(days=1),
+                                   deadline=now + timedelta(days=1))
+
+
+def make_group(name='G', course=None):
+    teacher = User.objects.create(username=f'teacher-{name}', role='teacher', fullname=f'Teacher {name}')
+    return Group.objects.create(name=name, teacher=teacher, course=course)
+
+
+def make_student(group, name):
+    return User.objects.create(username=name, role='student', fullname=name.title(), group=group)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SQLiteConcurrencyTests(TransactionTestCase):
+    # Runs on its own throwaway database file; the test database is only used for the command's lookups
+
+    def test_concurrent_writers_hit_no_lock_errors(self):
+        out = StringIO()
+        # Raises CommandError on any "database is locked" error
+        call_command('sqlite_stress', writers=4, iterations=25, stdout=out)
+        self.assertIn('No lock errors', out.getvalue())
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class SnapshotExportTests(TransactionTestCase):
+
+    def exported(self, directory, label):
+        with gzip.open(os.path.join(directory, f'{label}.ndjson.gz'), 'rt') as fh:
+            return [json.loads(line) for line in fh]
+
+    def test_rows_written_during_the_export_are_left_out(self):
+        make_group('A')
+
+        def write_group(label, rows):
+            if label == 'apps.user':
+                # Another connection commits a teacher and their group after the users were read
+                worker = threading.Thread(target=lambda: (make_group('B'), connection.close()))
+                worker.start()
+                worker.join()
+
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = export_snapshot(directory, labels={'apps.user', 'apps.group'}, progress=write_group)
+        self.assertEqual({t['model']: t['rows'] for t in manifest['tables']}, {'apps.user': 1, 'apps.group': 1})
+        self.assertEqual(Group.objects.count(), 2)
+
+    def test_pseudonymized_export_drops_password_hashes(self):
+        teacher = make_group('A').teacher
+        teacher.set_password('secret')
+        teacher.save()
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = export_snapshot(directory, labels={'apps.user'}, pseudonymize=True)
+            fields = manifest['tables'][0]['fields']
+            row = dict(zip(fields, self.exported(directory, 'apps.user')[0]))
+        self.assertNotIn(teacher.password, json.dumps(row))
+        self.assertFalse(User(password=row['password']).has_usable_password())
+
+
+class DeltaEncodingTests(TestCase):
+
+    def test_delta_round_trips(self):
+        cases = [
+            ('', 'print(1)\n'),
+            ('a\nb\nc\n', 'a\nB\nc\n'),
+            ('a\nb\nc\n', 'c\nb\na\n'),
+            ('no newline', 'no newline at the end'),
+            ('keep\n' * 50, 'keep\n' * 25 + 'new\n' + 'keep\n' * 24),
+            ('x\n', ''),
+        ]
+        for old, new in cases:
+            with self.subTest(old=old[:20], new=new[:20]):
+                self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+
+    def test_unchanged_lines_are_copied_not_stored(self):
+        old = ''.join(f'line {i}\n' for i in range(200))
+        new = old.replace('line 100\n', 'line one hundred\n')
+        self.assertLess(len(make_delta(old, new)), 100)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+@override_settings(THROTTLE_STORE_PATH=':memory:')
+class VersionedSubmissionTests(TestCase):
+
+    def setUp(self):
+        group = make_group()
+        self.homework = make_homework(group)
+        self.student = make_student(group, 'student')
+
+    def test_every_version_is_reconstructed(self):
+        submitted = []
+        for i in range(KEYFRAME_INTERVAL + 5):
+            files = {'main.py': ''.join(f'print({j})\n' for j in range(i + 1))}
+            if i % 3 == 0:
+                files['util.py'] = f'VALUE = {i}\n'
+            submission = submit(self.homework, self.student,
+                                [{'file_name': name, 'content': content} for name, content in files.items()])
+            submitted.append(files)
+
+        self.assertEqual(submission.version, len(submitted))
+        for version, files in enumerate(submitted, start=1):
+            with self.subTest(version=version):
+                self.assertEqual(reconstruct(submission, version), files)
+        # Keyframes bound the number of diffs replayed for main.py
+        kinds = list(submission.file_versions.filter(file_name='main.py').order_by('version')
+                     .values_list('kind', flat=True))
+        self.assertEqual(kinds.count('full'), 2)
+
+    def test_resubmission_through_the_api_creates_a_version(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        for content in ('print(1)\n', 'print(2)\n'):
+            response = client.post('/api/api/student/create-homework', {
+                'homework': self.homework.pk, 'upload': [{'file_name': 'main.py', 'content': content}],
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        submission = self.homework.submissions.get()
+        self.assertEqual(submission.version, 2)
+        self.assertEqual(reconstruct(submission, 1), {'main.py': 'print(1)\n'})
+
+    def test_unknown_submission_ids_are_not_found(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        for pk in ('999', 'abc'):
+            with self.subTest(pk=pk):
+                self.assertEqual(client.get(f'/api/api/student/submissions/{pk}/').status_code, 404)
+
+    def test_empty_file_can_be_uploaded(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.post('/api/api/student/create-homework', {
+            'homework': self.homework.pk, 'upload': [{'file_name': 'main.py', 'content': ''}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.homework.submissions.get().files.get().line_count, 0)
+
+    @mock.patch('apps.metrics.schedule_metrics')
+    @mock.patch('apps.sandbox.check_isolation', side_effect=SandboxUnavailable('no namespaces'))
+    def test_submission_succeeds_when_the_sandbox_is_unavailable(self, check_isolation, schedule_metrics):
+        HomeworkTestCase.objects.create(homework=self.homework, name='prints one', expected_output='1')
+        client = APIClient()
+        client.force_authenticate(self.student)
+        with self.assertLogs('apps.versioning', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/api/student/create-homework', {
+                'homework': self.homework.pk, 'upload': [{'file_name': 'main.py', 'content': 'print(1)\n'}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        check_isolation.assert_called_once()
+        self.assertEqual(self.homework.submissions.get().version, 1)
+
+
+@override_settings(REST_FRAMEWORK=TIGHT_RATES)
+class ThrottleTests(TestCase):
+    # Each test gets a fresh in-memory bucket store, never the shared throttle file
+
+    def login(self, ip):
+        return APIClient().post('/api/token/', {'username': 'nobody', 'password': 'wrong'}, REMOTE_ADDR=ip)
+
+    @override_settings(THROTTLE_STORE_PATH=':memory:')
+    def test_rejected_logins_do_not_drain_the_endpoint_bucket(self):
+        statuses = [self.login('10.0.0.1').status_code for _ in range(10)]
+        self.assertEqual(statuses.count(429), 8)
+        # Two of the endpoint's three tokens went to the first client's accepted attempts
+        self.assertEqual(self.login('10.0.0.2').status_code, 401)
+
+    @override_settings(THROTTLE_STORE_PATH=':memory:')
+    def test_rejected_submissions_do_not_drain_the_endpoint_bucket(self):
+        group = make_group()
+        homework = make_homework(group)
+        greedy, other = make_student(group, 'greedy'), make_student(group, 'other')
+        client = APIClient()
+        client.force_authenticate(greedy)
+        statuses = [client.post('/api/api/student/create-homework', {'homework': homework.pk}, format='json')
+                    .status_code for _ in range(10)]
+        self.assertEqual(statuses.count(429), 8)
+        client.force_authenticate(other)
+        response = client.post('/api/api/student/create-homework', {'homework': homework.pk}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+
+@override_settings(CACHES=LOCAL_CACHE, DELETION_INLINE_LIMIT=0, THROTTLE_STORE_PATH=':memory:')
+class ScheduledDeletionTests(TestCase):
+
+    def setUp(self):
+        self.group = make_group()
+        self.homework = make_homework(self.group)
+        self.student = make_student(self.group, 'student')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def assertHomeworkHidden(self):
+        response = self.client.get('/api/api/student/my-homework')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        response = self.client.post('/api/api/student/create-homework', {'homework': self.homework.pk},
+                                    format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+
+    def test_group_deletion_hides_its_homeworks(self):
+        self.assertIsNotNone(schedule_deletion(self.group))
+        self.assertHomeworkHidden()
+
+    def test_teacher_deletion_hides_their_groups_and_homeworks(self):
+        self.assertIsNotNone(schedule_deletion(self.group.teacher))
+        self.group.refresh_from_db()
+        self.assertIsNotNone(self.group.deleting_at)
+        self.assertHomeworkHidden()
+
+
+@override_settings(CACHES=LOCAL_CACHE, THROTTLE_STORE_PATH=':memory:')
+class SessionListTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username='student', password='secret', role='student', fullname='Student')
+        # Stands in for the buffer of the worker that served the login; it never flushes here
+        self.other_worker = WriteBehindBuffer(UserSession)
+        self.other_worker.start = lambda: None
+
+    def login(self):
+        with mock.patch('apps.session_buffer.get_session_buffer', return_value=self.other_worker):
+            response = APIClient().post('/api/token/', {'username': 'student', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200, response.content)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        return client
+
+    def test_sessions_buffered_by_another_worker_are_listed(self):
+        client = self.login()
+        self.assertFalse(UserSession.objects.exists())
+        response = client.get('/api/sessions-list')
+        self.assertEqual([s['jti'] for s in response.json()['sessions']], [self.other_worker.rows[0].jti])
+
+    def test_deleted_sessions_are_not_written_back(self):
+        client = self.login()
+        session = client.get('/api/sessions-list').json()['sessions'][0]
+        pk = UserSession.objects.get(jti=session['jti']).pk
+        self.assertEqual(client.delete(f'/api/api/auth/sessions/delete/{pk}').status_code, 204)
+        self.assertEqual(client.get('/api/sessions-list').json()['sessions'], [])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ScoreRollupTests(TestCase):
+
+    def setUp(self):
+        self.group = make_group()
+        self.homework = make_homework(self.group)
+        self.student = make_student(self.group, 'student')
+
+    def grade(self, value):
+        submission = Submission.objects.get(pk=submit(self.homework, self.student).pk)
+        submission.final_grade = value
+        submission.save()
+
+    def test_grade_writes_update_the_daily_snapshots(self):
+        self.grade(5)
+        self.grade(8)
+        self.grade(None)
+        self.grade(6)
+        today = timezone.localdate()
+        for owner_type, owner_id in (('student', self.student.pk), ('group', self.group.pk)):
+            snapshot = ScoreSnapshot.objects.get(owner_type=owner_type, owner_id=owner_id, period='day')
+            self.assertEqual(snapshot.period_start, today)
+            self.assertEqual((snapshot.total_score, snapshot.delta, snapshot.changes), (6, 6, 4))
+
+    def test_a_new_day_continues_from_the_last_total(self):
+        today = timezone.localdate()
+        record_score_change(self.student.pk, None, 5, day=today - timedelta(days=2))
+        record_score_change(self.student.pk, None, 3, day=today)
+        points = list(trajectory('student', self.student.pk).values_list('period_start', 'total_score', 'delta'))
+        self.assertEqual(points, [(today - timedelta(days=2), 5, 5), (today, 8, 3)])
+
+    def test_compaction_keeps_the_running_total(self):
+        monday = timezone.localdate() - timedelta(days=timezone.localdate().weekday() + 14)
+        for offset, delta in ((0, 2), (1, 3), (7, 4), (8, -1)):
+            record_score_change(self.student.pk, None, delta, day=monday + timedelta(days=offset))
+
+        self.assertEqual(compact('day', 'week', timezone.localdate()), 4)
+        weeks = list(trajectory('student', self.student.pk).values_list('period', 'period_start', 'total_score',
+                                                                         'delta', 'changes'))
+        self.assertEqual(weeks, [('week', monday, 5, 5, 2), ('week', monday + timedelta(days=7), 8, 3, 2)])
+        # Compacting again finds nothing left to merge
+        self.assertEqual(compact('day', 'week', timezone.localdate()), 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CourseAggregateTests(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.create(name='Python')
+        self.groups = [make_group('A', self.course), make_group('B', self.course)]
+        self.students = [make_student(self.groups[i % 2], f'student{i}') for i in range(6)]
+
+    def aggregates(self):
+        return (
+            sorted(CourseStanding.objects.values_list('student_id', 'group_id', 'total_score', 'submitted', 'graded')),
+            sorted(CourseHomeworkStats.objects.values_list('template', 'homeworks', 'assigned', 'submitted',
+                                                           'graded', 'score_sum')),
+            sorted(CourseGroupStats.objects.values_list('group_id', 'students', 'submitted', 'graded', 'score_sum')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.aggregates()
+        refresh_course(self.course.pk)
+        self.assertEqual(incremental, self.aggregates())
+
+    def grade(self, homework, student, value):
+        submission = Submission.objects.get(pk=submit(homework, student).pk)
+        submission.final_grade = value
+        submission.save()
+
+    def test_incremental_counters_match_a_rebuild(self):
+        homeworks = [make_homework(group, title) for group in self.groups for title in ('Loops', 'Functions')]
+        for n, homework in enumerate(homeworks):
+            for student in self.students:
+                if student.group_id == homework.group_id and (n + student.pk) % 3:
+                    self.grade(homework, student, (n + student.pk) % 10)
+        # Resubmitting, regrading and clearing a grade
+        submit(homeworks[0], self.students[0])
+        self.grade(homeworks[0], self.students[2], None)
+        self.grade(homeworks[1], self.students[2], 9)
+        # Membership changes after the homeworks exist
+        moved = User.objects.get(pk=self.students[1].pk)
+        moved.group = self.groups[0]
+        moved.save()
+        make_student(self.groups[1], 'latecomer')
+        self.assertMatchesRebuild()
+
+    def test_joining_a_group_counts_towards_completion(self):
+        homework = make_homework(self.groups[0])
+        for student in self.students[::2]:
+            submit(homework, student)
+        stats = CourseHomeworkStats.objects.get(course=self.course, template=homework.template)
+        self.assertEqual((stats.assigned, stats.submitted), (3, 3))
+
+        newcomer = make_student(None, 'newcomer')
+        newcomer.group = self.groups[0]
+        newcomer.save()
+        stats.refresh_from_db()
+        self.assertEqual((stats.assigned, stats.submitted), (4, 3))
+        self.assertMatchesRebuild()
+
+    def test_linking_a_group_rebuilds_both_courses(self):
+        other = Course.objects.create(name='Other')
+        homework = make_homework(self.groups[1])
+        self.grade(homework, self.students[1], 7)
+        group = Group.objects.get(pk=self.groups[1].pk)
+        group.course = other
+        group.save()
+        self.assertFalse(CourseGroupStats.objects.filter(course=self.course, group=group).exists())
+        self.assertEqual(CourseStanding.objects.get(course=other, student=self.students[1]).total_score, 7)
+
+    def test_creating_a_group_does_not_rebuild_the_course(self):
+        self.grade(make_homework(self.groups[0]), self.students[0], 5)
+        with mock.patch('apps.courses.refresh_course') as rebuild:
+            make_group('C', self.course)
+        rebuild.assert_not_called()
+        self.assertMatchesRebuild()
+
+    def test_standings_endpoint_ranks_by_score(self):
+        homework = make_homework(self.groups[0])
+        for score, student in zip((4, 9, 6), self.students[::2]):
+            self.grade(homework, student, score)
+        admin = User.objects.create(username='admin', role='admin', fullname='Admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(f'/api/admin/courses/{self.course.pk}/standings/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        rows = [(row['rank'], row['student'], row['total_score']) for row in response.json()['results']]
+        self.assertEqual(rows, [(1, self.students[2].pk, 9), (2, self.students[4].pk, 6)])
+        self.assertIsNotNone(response.json()['next'])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class HomeworkSchedulerTests(TestCase):
+
+    def test_deadline_fires_once_due(self):
+        homework = make_homework(make_group())
+        scheduler = HomeworkScheduler()
+        now = timezone.now()
+        self.assertEqual(scheduler.run_once(now), 1)  # the start event, already in the past
+        self.assertEqual(scheduler.run_once(homework.deadline + timedelta(seconds=1)), 1)
+        homework.refresh_from_db()
+        self.assertEqual(homework.status, 'closed')
+        self.assertEqual(set(homework.jobs.values_list('status', flat=True)), {'done'})
+
+    def test_extended_deadline_does_not_fire_at_the_old_time(self):
+        homework = make_homework(make_group())
+        old_deadline = homework.deadline
+        scheduler = HomeworkScheduler()
+        scheduler.run_once(old_deadline - timedelta(minutes=1))  # loads the deadline into the heap
+
+        homework = Homework.objects.get(pk=homework.pk)
+        homework.deadline = old_deadline + timedelta(days=7)
+        homework.save()
+        self.assertEqual(scheduler.run_once(old_deadline + timedelta(seconds=1)), 0)
+        homework.refresh_from_db()
+        self.assertEqual(homework.status, 'open')
+        self.assertEqual(homework.jobs.get(event='deadline').status, 'pending')
+
+        self.assertEqual(scheduler.run_once(homework.deadline + timedelta(seconds=1)), 1)
+        homework.refresh_from_db()
+        self.assertEqual(homework.status, 'closed')
+
+
+class SandboxEscapeTests(TestCase):
+    # Student code prints "blocked" when the escape fails, so a passing case means the sandbox held
+
+    def run_student_code(self, code):
+        job = {'extension': '.py', 'files': [('main.py', code)], 'cases': [('escape', '', 'blocked', 1)],
+               'limits': get_limits()}
+        return run_tests(job, hidden_paths())[0]
+
+    def assertBlocked(self, code):
+        result = self.run_student_code(code)
+        self.assertEqual(result['status'], 'passed', result['detail'])
+
+    def test_network_is_blocked(self):
+        with socket.socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen()
+            port = server.getsockname()[1]
+            self.assertBlocked(
+                'try:\n'
+                '    import socket\n'
+                f'    socket.create_connection(("127.0.0.1", {port}), timeout=1)\n'
+                '    print("escaped")\n'
+                'except Exception:\n'
+                '    print("blocked")\n')
+
+    def test_files_outside_the_workdir_are_blocked(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as secret:
+            secret.write('secret')
+            secret.flush()
+            self.assertBlocked(
+                'try:\n'
+                f'    print(open({secret.name!r}).read())\n'
+                'except Exception:\n'
+                '    print("blocked")\n')
+
+    def test_sqlite_databases_are_blocked(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'grades.sqlite3')
+            with sqlite3.connect(path) as db:
+                db.execute('create table t (v text)')
+                db.execute("insert into t values ('secret')")
+            db.close()
+            self.assertBlocked(
+                'try:\n'
+                '    import sqlite3\n'
+                f'    print(sqlite3.connect({path!r}).execute("select v from t").fetchone()[0])\n'
+                'except Exception:\n'
+                '    print("blocked")\n')
+
+    @skipUnless(probe_isolation(hidden_paths()), 'namespaces are not available on this host')
+    def test_project_tree_is_hidden(self):
+        # os.stat raises no audit event, so only the mount namespace keeps this from the student
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        self.assertBlocked(f'import os\nprint("escaped" if os.path.exists({manage!r}) else "blocked")\n')
+
+
+class RequestProfileTests(SimpleTestCase):
+
+    def test_nested_sql_is_not_counted_twice(self):
+        profile = RequestProfile()
+
+        def run_query(sql, params, many, context):
+            time.sleep(0.03)
+
+        @timed('serialization')
+        def serialize():
+            time.sleep(0.01)
+            profile(run_query, 'SELECT 1', None, False, {})
+
+        token = _current.set(profile)
+        started = time.perf_counter()
+        serialize()
+        total = time.perf_counter() - started
+        _current.reset(token)
+
+        self.assertGreaterEqual(profile.phases['queryset'], 0.03)
+        self.assertLess(profile.phases['serialization'], 0.03)
+        self.assertLessEqual(sum(profile.phases.values()), total)
+        self.assertEqual(profile.queries, 1)
@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Refill and take happen in one statement, so concurrent workers can never overdraw a bucket
+TAKE_SQL = """
+INSERT INTO bucket (key, tokens, updated) VALUES (:key, :capacity - 1, :now)
+ON CONFLICT (key) DO UPDATE
+    SET tokens = min(:capacity, tokens + (:now - updated) * :rate) - 1, updated = :now
+    WHERE min(:capacity, tokens + (:now - updated) * :rate) >= 1
+RETURNING tokens
+"""
+PEEK_SQL = "SELECT min(:capacity, tokens + (:now - updated) * :rate) FROM bucket WHERE key = :key"
+
+
+class BucketStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('PRAGMA busy_timeout=1000')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self.local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate):
+        """Take one token; returns seconds to wait, or None when the request may pass."""
+        params = {'key': key, 'capacity': capacity, 'rate': rate, 'now': time.time()}
+        if self.connection.execute(TAKE_SQL, params).fetchone() is not None:
+            return None
+        row = self.connection.execute(PEEK_SQL, params).fetchone()
+        tokens = row[0] if row else 0
+        return max(0.0, (1 - tokens) / rate)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM bucket')
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = BucketStore(getattr(settings, 'THROTTLE_STORE_PATH', settings.BASE_DIR / 'throttle.sqlite3'))
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(setting, **kwargs):
+    # Lets tests point the buckets at their own file (or ':memory:') with override_settings
+    global _store
+    if setting == 'THROTTLE_STORE_PATH':
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket per scope. Rates use the DRF format in DEFAULT_THROTTLE_RATES,
+    e.g. '10/min' is a bucket of 10 tokens refilled at 10 per minute.
+    key_by is one of 'ip', 'user', 'username' or 'endpoint'.
+    """
+    scope = None
+    key_by = 'ip'
+
+    def __init__(self):
+        self.capacity, self.rate = self.parse_rate(self.get_rate())
+        self.wait_seconds = None
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No throttle rate set for '{self.scope}' scope")
+
+    def parse_rate(self, rate):
+        num, period = rate.split('/')
+        capacity = int(num)
+        return capacity, capacity / PERIODS[period[0]]
+
+    def get_ident_key(self, request):
+        if self.key_by == 'user':
+            if request.user and request.user.is_authenticated:
+                return f'user:{request.user.pk}'
+            return f'ip:{self.get_ident(request)}'
+        if self.key_by == 'username':
+            username = request.data.get('username') if hasattr(request, 'data') else None
+            return f'username:{str(username).lower()}' if username else None
+        if self.key_by == 'endpoint':
+            return 'all'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        self.wait_seconds = get_store().take(f'{self.scope}:{ident}', self.capacity, self.rate)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    scope = 'login_ip'
+    key_by = 'ip'
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    scope = 'login_username'
+    key_by = 'username'
+
+
+class LoginEndpointThrottle(TokenBucketThrottle):
+    scope = 'login'
+    key_by = 'endpoint'
+
+
+class RegisterIPThrottle(TokenBucketThrottle):
+    scope = 'register_ip'
+    key_by = 'ip'
+
+
+class RegisterEndpointThrottle(TokenBucketThrottle):
+    scope = 'register'
+    key_by = 'endpoint'
+
+
+class SubmissionUserThrottle(TokenBucketThrottle):
+    scope = 'submission_user'
+    key_by = 'user'
+
+
+class SubmissionEndpointThrottle(TokenBucketThrottle):
+    scope = 'submission'
+    key_by = 'endpoint'
+
+
+class ChainedThrottle(BaseThrottle):
+    """
+    Checks throttle_classes in order and stops at the first rejection. DRF itself asks every
+    throttle, so a client already over its own bucket would still drain the shared endpoint
+    bucket; listing that one last only charges it for requests every other bucket let through.
+    """
+    throttle_classes = ()
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not throttle.allow_request(request, view):
+                self.wait_seconds = throttle.wait()
+                return False
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class LoginThrottle(ChainedThrottle):
+    throttle_classes = (LoginIPThrottle, LoginUsernameThrottle, LoginEndpointThrottle)
+
+
+class RegisterThrottle(ChainedThrottle):
+    throttle_classes = (RegisterIPThrottle, RegisterEndpointThrottle)
+
+
+class SubmissionThrottle(ChainedThrottle):
+    throttle_classes = (SubmissionUserThrottle, SubmissionEndpointThrottle)
+
+
+LOGIN_THROTTLES = [LoginThrottle]
+REGISTER_THROTTLES = [RegisterThrottle]
+SUBMISSION_THROTTLES = [SubmissionThrottle]
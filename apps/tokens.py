@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from rest_framework_simplejwt.settings import api_settings
+
+TOKEN_VERSION_CLAIM = 'ver'
+# Version of a user that may no longer authenticate (deleted, inactive or being deleted)
+REVOKED = -1
+# Each process has its own copy of these, so a version published by one worker never reaches the others
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',
+                        'django.core.cache.backends.dummy.DummyCache')
+
+
+def _cache_key(user_id):
+    return f'token_version:{user_id}'
+
+
+def _cache_timeout():
+    # Past this an access token has expired anyway, so a stale entry cannot outlive the tokens it guards
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def stamp_claims(token, user):
+    token['role'] = user.role
+    token['group_id'] = user.group_id
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def current_token_version(user_id):
+    version = cache.get(_cache_key(user_id))
+    if version is None:
+        from apps.models import User
+        version = (User.objects.filter(pk=user_id, is_active=True, deleting_at__isnull=True)
+                   .values_list('token_version', flat=True).first())
+        if version is None:
+            version = REVOKED
+        # add, not set: a version published while the row was read must not be overwritten by the older one
+        if not cache.add(_cache_key(user_id), version, _cache_timeout()):
+            version = cache.get(_cache_key(user_id), version)
+    return version
+
+
+def publish_token_version(user_id, version):
+    cache.set(_cache_key(user_id), version, _cache_timeout())
+
+
+def forget_token_version(user_id):
+    """For writes that bypass User.save(); the next request re-reads the row."""
+    cache.delete(_cache_key(user_id))
+
+
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND', PROCESS_LOCAL_CACHES[0])
+    if backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            f'The default cache ({backend}) is not shared between processes.',
+            hint='Token versions and grade analytics versions are published through the cache; '
+                 'configure CACHES with Redis, Memcached or the file-based backend.',
+            id='apps.E001',
+        )]
+    return []
@@ -4,7 +4,8 @@ from rest_framework.routers import DefaultRouter
 from apps.views import SessionListView, SessionDestroyAPIView, \
     LeaderBoardListAPIView, GetStudentHomeworkListAPIView, HomeworkCreateAPIView, StudentSubmissionListAPIView, \
     RegisterCreateAPIView, TeacherHomeworkViewSet, TeacherGroupViewSet, TeacherSubmissionViewSet, TeacherViewSet, \
-    StudentViewSet, GroupViewSet
+    StudentViewSet, GroupViewSet, ScoreHistoryAPIView, DeletionJobViewSet, CourseViewSet, TeacherCourseViewSet, \
+    StudentSubmissionViewSet
 
 urlpatterns = [
     # path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -16,6 +17,7 @@ urlpatterns = [
     path('api/student/my-homework', GetStudentHomeworkListAPIView.as_view()),
     path('api/student/create-homework', HomeworkCreateAPIView.as_view()),
     path('api/student/submissions/list', StudentSubmissionListAPIView.as_view()),
+    path('api/student/score-history', ScoreHistoryAPIView.as_view()),
 
 
 
@@ -27,10 +29,15 @@ urlpatterns += [
     path('auth/register/', RegisterCreateAPIView.as_view(), name='register'),
 ]
 
+# Student routes
+student_router = DefaultRouter()
+student_router.register(r'api/student/submissions', StudentSubmissionViewSet, basename='student-submissions')
+
 # Teacher routes
 teacher_router = DefaultRouter()
 teacher_router.register(r'teacher/homework', TeacherHomeworkViewSet, basename='teacher-homework')
 teacher_router.register(r'teacher/groups', TeacherGroupViewSet, basename='teacher-groups')
+teacher_router.register(r'teacher/courses', TeacherCourseViewSet, basename='teacher-courses')
 teacher_router.register(r'teacher/submissions', TeacherSubmissionViewSet, basename='teacher-submissions')
 
 # Admin routes
@@ -38,7 +45,10 @@ admin_router = DefaultRouter()
 admin_router.register(r'admin/teacher', TeacherViewSet, basename='admin-teachers')
 admin_router.register(r'admin/student', StudentViewSet, basename='admin-students')
 admin_router.register(r'admin/groups', GroupViewSet, basename='admin-groups')
+admin_router.register(r'admin/courses', CourseViewSet, basename='admin-courses')
+admin_router.register(r'admin/deletions', DeletionJobViewSet, basename='admin-deletions')
 
 
+urlpatterns += student_router.urls
 urlpatterns += teacher_router.urls
 urlpatterns += admin_router.urls
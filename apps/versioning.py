@@ -0,0 +1,124 @@
+import json
+import logging
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from apps.courses import record_submission
+from apps.models import Submission, SubmissionFile, SubmissionFileVersion
+from apps.sandbox import SandboxUnavailable, run_homework_tests
+
+logger = logging.getLogger(__name__)
+# Every Nth stored change of a file is kept in full, so rebuilding a version never replays more diffs than this
+KEYFRAME_INTERVAL = 20
+
+
+def make_delta(old, new):
+    """Line diff as JSON: [i, j] copies old lines i..j, a string inserts new text."""
+    a, b = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(b[j1:j2]))
+    return json.dumps(ops, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    lines = old.splitlines(keepends=True)
+    return ''.join(''.join(lines[op[0]:op[1]]) if isinstance(op, list) else op for op in json.loads(delta))
+
+
+def submit(homework, student, files=None):
+    """
+    Creates or resubmits (homework, student) without relying on IntegrityError.
+    files is a list of {'file_name', 'content'}; None keeps the current files.
+    """
+    with transaction.atomic():
+        # INSERT .. ON CONFLICT DO NOTHING, then bump the version; the UPDATE also takes the row lock
+        Submission.objects.bulk_create([Submission(homework=homework, student=student)], ignore_conflicts=True)
+        Submission.objects.filter(homework=homework, student=student).update(
+            version=F('version') + 1, submitted_at=timezone.now())
+        submission = Submission.objects.get(homework=homework, student=student)
+        if submission.version == 1:
+            record_submission(homework, student.pk)
+        if files is not None:
+            _store_files(submission, {f['file_name']: f['content'] for f in files})
+            if homework.test_cases.exists():
+                # robust: the submission is already saved, so grading trouble must not fail the request
+                transaction.on_commit(lambda: _run_tests(homework, submission.pk), robust=True)
+    return submission
+
+
+def _run_tests(homework, submission_id):
+    try:
+        run_homework_tests(homework, Submission.objects.filter(pk=submission_id))
+    except SandboxUnavailable as exc:
+        logger.warning('Submission %s was not tested: %s', submission_id, exc)
+
+
+def _store_files(submission, new_files):
+    version = submission.version
+    current = {f.file_name: f for f in submission.files.all()}
+    stored = dict(SubmissionFileVersion.objects.filter(submission=submission)
+                  .values('file_name').annotate(n=Count('id')).values_list('file_name', 'n'))
+    rows = []
+
+    for name, content in new_files.items():
+        latest = current.get(name)
+        if latest is not None and latest.content == content:
+            continue
+        if latest is None or stored.get(name, 0) % KEYFRAME_INTERVAL == 0:
+            rows.append(SubmissionFileVersion(submission=submission, file_name=name, version=version,
+                                              kind='full', data=content))
+        else:
+            rows.append(SubmissionFileVersion(submission=submission, file_name=name, version=version,
+                                              kind='diff', data=make_delta(latest.content, content)))
+        # SubmissionFile keeps the latest content, so current reads never rebuild anything
+        latest = latest or SubmissionFile(submission=submission, file_name=name)
+        latest.content = content
+        latest.save()
+
+    for name in current.keys() - new_files.keys():
+        rows.append(SubmissionFileVersion(submission=submission, file_name=name, version=version, kind='deleted'))
+        current[name].delete()
+
+    SubmissionFileVersion.objects.bulk_create(rows)
+
+
+def reconstruct_file(submission, file_name, version):
+    history = SubmissionFileVersion.objects.filter(submission=submission, file_name=file_name, version__lte=version)
+    keyframe = history.filter(kind__in=['full', 'deleted']).aggregate(v=Max('version'))['v']
+    if keyframe is None:
+        return None
+
+    content = None
+    for kind, data in history.filter(version__gte=keyframe).order_by('version').values_list('kind', 'data'):
+        if kind == 'full':
+            content = data
+        elif kind == 'diff':
+            content = apply_delta(content, data)
+        else:
+            content = None
+    return content
+
+
+def reconstruct(submission, version):
+    """Returns {file_name: content} as the submission looked at the given version."""
+    if version >= submission.version:
+        return {f.file_name: f.content for f in submission.files.all()}
+    names = (SubmissionFileVersion.objects.filter(submission=submission, version__lte=version)
+             .values_list('file_name', flat=True).distinct())
+    files = {name: reconstruct_file(submission, name, version) for name in names}
+    return {name: content for name, content in files.items() if content is not None}
+
+
+def history(submission):
+    changes = {}
+    for version, file_name, kind in (SubmissionFileVersion.objects.filter(submission=submission)
+                                     .order_by('version', 'file_name').values_list('version', 'file_name', 'kind')):
+        changes.setdefault(version, []).append({'file_name': file_name, 'change': kind})
+    return [{'version': v, 'changes': changes.get(v, [])} for v in range(1, submission.version + 1)]
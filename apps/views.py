@@ -1,31 +1,83 @@
-from django.db.models import Sum
-from django.http import JsonResponse
+from django.http import Http404
+from django.utils.dateparse import parse_date
 from drf_spectacular.utils import extend_schema
 from rest_framework.generics import DestroyAPIView, CreateAPIView, ListAPIView
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from apps.models import UserSession, User
 from apps.serializer import  CreateHomeworkSerializer, UserSerializer, \
     UserProfileSerializer, TeacherSerializer, StudentSerializer
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, generics, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from apps.models import Homework, Group, Submission, Grade
+from apps.models import Homework, Group, Submission, Grade, ArchivedSubmission, DeletionJob, Course, CourseStanding
 from apps.permission import IsAdmin, IsTeacher, IsStudent
-from apps.serializer import HomeworkSerializer, GroupSerializer, SubmissionSerializer, GradeSerializer
+from apps.serializer import HomeworkSerializer, GroupSerializer, SubmissionSerializer, GradeSerializer, \
+    ScoreSnapshotSerializer, DeletionJobSerializer, HomeworkTestCaseSerializer, CourseSerializer, \
+    CourseStandingSerializer, CourseHomeworkStatsSerializer, CourseGroupStatsSerializer
+from apps.rollups import trajectory
+from apps.analytics import grade_analytics
+from apps.archive import rehydrate, student_totals, total_score_expression
+from apps.versioning import history, reconstruct
+from apps.deletion import schedule_deletion
+from apps.courses import courses_of, refresh_course
+from apps.sandbox import SandboxUnavailable, run_homework_tests
+from apps.filters import DirectorySearchFilter, UserDirectoryFilter
+from apps.pagination import TypeaheadPagination
+from apps.throttling import LOGIN_THROTTLES, REGISTER_THROTTLES, SUBMISSION_THROTTLES
+from apps.session_buffer import discard_pending_session, record_session, write_pending_sessions
+
+@extend_schema(tags=['auth'])
+class LoginTokenObtainPairView(TokenObtainPairView):
+    throttle_classes = LOGIN_THROTTLES
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        # The session row is buffered and written in bulk, never on the login path
+        refresh = RefreshToken(serializer.validated_data['refresh'], verify=False)
+        record_session(request, serializer.user, refresh)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=['auth'])
+class LoginTokenRefreshView(TokenRefreshView):
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        # Only a rotated refresh token starts a new session
+        if 'refresh' in serializer.validated_data:
+            refresh = RefreshToken(serializer.validated_data['refresh'], verify=False)
+            user = User(pk=refresh[api_settings.USER_ID_CLAIM])
+            record_session(request, user, refresh)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 
 @extend_schema(tags=['auth'])
 class SessionListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        # Read-your-writes: logins still buffered by any worker are written before the read
+        write_pending_sessions(request.user.pk)
         sessions = UserSession.objects.filter(user=request.user)
         session_data = []
 
@@ -46,6 +98,10 @@ class SessionDestroyAPIView(DestroyAPIView):
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        discard_pending_session(instance.user_id, instance.jti)
+        instance.delete()
+
 
 #TECHERIS
 #_____________________________________________________________________________________________________
@@ -57,7 +113,7 @@ class LeaderBoardListAPIView(ListAPIView):
         return (
             User.objects
             .filter(role='student')
-            .annotate(total_score=Sum('submission__final_grade'))
+            .annotate(total_score=total_score_expression())
             .order_by('-total_score')[:10]
         )
 
@@ -70,8 +126,8 @@ class GetStudentHomeworkListAPIView(ListAPIView):
     def get_queryset(self):
         user = self.request.user
 
-        if user.group:
-            return Homework.objects.filter(group=user.group)
+        if user.group_id:
+            return Homework.objects.filter(group_id=user.group_id, deleting_at__isnull=True)
         return Homework.objects.none()
 
 
@@ -81,6 +137,10 @@ class HomeworkCreateAPIView(CreateAPIView):
     queryset = Homework.objects.all()
     serializer_class = CreateHomeworkSerializer
     permission_classes = [IsAuthenticated, IsStudent]
+    throttle_classes = SUBMISSION_THROTTLES
+
+    def perform_create(self, serializer):
+        serializer.save(student=self.request.user)
 
 
 @extend_schema(tags=['student'])
@@ -90,24 +150,91 @@ class StudentSubmissionListAPIView(ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        qs = Submission.objects.filter(student=user)
+        qs = Submission.objects.filter(student=user, homework__deleting_at__isnull=True)
         # print(qs)
         return qs
 
 
 
+@extend_schema(tags=['student'])
+class ScoreHistoryAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        student_id = request.query_params.get('student')
+        group_id = request.query_params.get('group')
+
+        if not (group_id or student_id or '0').isdigit():
+            return Response({"error": "Invalid id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if group_id:
+            owner_type, owner_id = 'group', group_id
+            allowed = (user.role == 'admin'
+                       or (user.role == 'teacher' and Group.objects.filter(id=group_id, teacher=user).exists())
+                       or str(user.group_id) == group_id)
+        else:
+            owner_type, owner_id = 'student', student_id or str(user.id)
+            allowed = (user.role == 'admin' or owner_id == str(user.id)
+                       or (user.role == 'teacher'
+                           and User.objects.filter(id=owner_id, group__teacher=user).exists()))
+        if not allowed:
+            return Response({"error": "Not allowed"}, status=status.HTTP_403_FORBIDDEN)
+
+        dates = {}
+        for param in ('from', 'to'):
+            value = request.query_params.get(param)
+            try:
+                dates[param] = parse_date(value) if value else None
+            except ValueError:
+                dates[param] = None
+            if value and dates[param] is None:
+                return Response({"error": f"Invalid '{param}' date, expected YYYY-MM-DD"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        snapshots = trajectory(owner_type, owner_id, dates['from'], dates['to'])
+        return Response({
+            "owner_type": owner_type,
+            "owner_id": int(owner_id),
+            "points": ScoreSnapshotSerializer(snapshots, many=True).data,
+        })
+
+
 #__________________________________________________________________________________________________________________
 @extend_schema(tags=["auth"], responses=UserProfileSerializer)
 class RegisterCreateAPIView(CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserProfileSerializer
+    throttle_classes = REGISTER_THROTTLES
+
+
+class DeferredDestroyMixin:
+    # Big objects are hidden at once and deleted in batches by `manage.py process_deletions`
+
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        job = schedule_deletion(instance)
+        if job is None:
+            courses = courses_of(instance)
+            self.perform_destroy(instance)
+            # Small deletes only; background jobs rebuild the course stats in run_job
+            for course_id in courses:
+                refresh_course(course_id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response({"job": job.id, "status": job.status, "estimated_rows": job.estimated_rows},
+                        status=status.HTTP_202_ACCEPTED)
 
 
 @extend_schema(tags=["admin/teacher"])
-class TeacherViewSet(viewsets.ModelViewSet):
+class TeacherViewSet(DeferredDestroyMixin, viewsets.ModelViewSet):
     serializer_class = TeacherSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
-    queryset = User.objects.filter(role='teacher')
+    queryset = User.objects.filter(role='teacher', deleting_at__isnull=True)
+    filter_backends = [DjangoFilterBackend, DirectorySearchFilter]
+    filterset_class = UserDirectoryFilter
+    pagination_class = TypeaheadPagination
+    # Walks the (role, search_fullname) index; pk breaks ties between equal names
+    pagination_ordering = ('search_fullname', 'pk')
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -120,10 +247,15 @@ class TeacherViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=["admin/student"])
-class StudentViewSet(viewsets.ModelViewSet):
+class StudentViewSet(DeferredDestroyMixin, viewsets.ModelViewSet):
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
-    queryset = User.objects.filter(role='student')
+    queryset = User.objects.filter(role='student', deleting_at__isnull=True).select_related('group')
+    filter_backends = [DjangoFilterBackend, DirectorySearchFilter]
+    filterset_class = UserDirectoryFilter
+    pagination_class = TypeaheadPagination
+    # Walks the (role, search_fullname) index; pk breaks ties between equal names
+    pagination_ordering = ('search_fullname', 'pk')
 
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
@@ -142,7 +274,7 @@ class StudentViewSet(viewsets.ModelViewSet):
             return Response({"error": "Group ID required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            group = Group.objects.get(id=group_id)
+            group = Group.objects.get(id=group_id, deleting_at__isnull=True)
         except Group.DoesNotExist:
             return Response({"error": "Group not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -152,8 +284,8 @@ class StudentViewSet(viewsets.ModelViewSet):
 
 
 @extend_schema(tags=["admin/group"])
-class GroupViewSet(viewsets.ModelViewSet):
-    queryset = Group.objects.all()
+class GroupViewSet(DeferredDestroyMixin, viewsets.ModelViewSet):
+    queryset = Group.objects.filter(deleting_at__isnull=True).select_related('teacher', 'course')
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
     http_method_names = ['get', 'post', 'put', 'delete']
@@ -173,7 +305,7 @@ class GroupViewSet(viewsets.ModelViewSet):
             return Response({"error": "Teacher ID required"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            teacher = User.objects.get(id=teacher_id, role='teacher')
+            teacher = User.objects.get(id=teacher_id, role='teacher', deleting_at__isnull=True)
         except User.DoesNotExist:
             return Response({"error": "Teacher not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -184,35 +316,119 @@ class GroupViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"], url_path="leaderboard")
     def leaderboard(self, request, pk=None):
         group = self.get_object()
-        submissions = Submission.objects.filter(student__group=group, final_grade__isnull=False)
-        scores = {}
-
-        for s in submissions:
-            user = s.student
-            if user.id not in scores:
-                scores[user.id] = {
-                    'id': user.id,
-                    'fullname': user.fullname,
-                    'total_score': 0
-                }
-            scores[user.id]['total_score'] += s.final_grade
-
-        leaderboard = sorted(scores.values(), key=lambda x: x['total_score'], reverse=True)
+        totals = student_totals(student__group=group)
+        students = User.objects.filter(id__in=totals).values_list('id', 'fullname')
+        scores = [{'id': pk, 'fullname': fullname, 'total_score': totals[pk]} for pk, fullname in students]
+
+        leaderboard = sorted(scores, key=lambda x: x['total_score'], reverse=True)
         return Response(leaderboard)
 
+    @action(detail=True, methods=["get"], url_path="analytics")
+    def analytics(self, request, pk=None):
+        group = self.get_object()
+        return Response(grade_analytics('group', group.pk))
+
+
+class CourseStatsMixin:
+    # Reads from the aggregate tables apps.courses keeps current; no per-request grouping over submissions
+
+    @extend_schema(responses=CourseStandingSerializer(many=True))
+    @action(methods=['get'], detail=True, url_path='standings')
+    def standings(self, request, pk=None):
+        course = self.get_object()
+        queryset = CourseStanding.objects.filter(course=course).select_related('student', 'group') \
+            .order_by('-total_score', 'student_id')
+        paginator = TypeaheadPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        rows = page if page is not None else list(queryset)
+        offset = paginator.offset if page is not None else 0
+        for rank, row in enumerate(rows, start=offset + 1):
+            row.rank = rank
+        data = CourseStandingSerializer(rows, many=True).data
+        return paginator.get_paginated_response(data) if page is not None else Response(data)
+
+    @extend_schema(responses=CourseHomeworkStatsSerializer(many=True))
+    @action(methods=['get'], detail=True, url_path='homeworks')
+    def homeworks(self, request, pk=None):
+        course = self.get_object()
+        return Response(CourseHomeworkStatsSerializer(course.homework_stats.order_by('template'), many=True).data)
+
+    @extend_schema(responses=CourseGroupStatsSerializer(many=True))
+    @action(methods=['get'], detail=True, url_path='groups')
+    def groups(self, request, pk=None):
+        course = self.get_object()
+        stats = course.group_stats.select_related('group').order_by('group__name')
+        return Response(CourseGroupStatsSerializer(stats, many=True).data)
+
+
+@extend_schema(tags=["admin/courses"])
+class CourseViewSet(CourseStatsMixin, viewsets.ModelViewSet):
+    queryset = Course.objects.all()
+    serializer_class = CourseSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+    http_method_names = ['get', 'post', 'put', 'delete']
+
+    @action(methods=['post'], detail=True, url_path='refresh')
+    def refresh(self, request, pk=None):
+        course = self.get_object()
+        refresh_course(course.pk)
+        return Response({"message": f"Statistics of course {course.name} rebuilt"})
+
+
+@extend_schema(tags=["admin/deletions"])
+class DeletionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = DeletionJob.objects.all()
+    serializer_class = DeletionJobSerializer
+    permission_classes = [IsAuthenticated, IsAdmin]
+
 
 @extend_schema(tags=["teacher"])
-class TeacherHomeworkViewSet(viewsets.ModelViewSet):
+class TeacherHomeworkViewSet(DeferredDestroyMixin, viewsets.ModelViewSet):
     serializer_class = HomeworkSerializer
     permission_classes = [IsAuthenticated, IsTeacher]
     http_method_names = ['get', 'post', 'put', 'delete']
 
     def get_queryset(self):
-        return Homework.objects.filter(teacher=self.request.user)
+        return Homework.objects.filter(teacher=self.request.user, deleting_at__isnull=True)
 
     def perform_create(self, serializer):
         serializer.save(teacher=self.request.user)
 
+    @action(methods=['get'], detail=True, url_path='analytics')
+    def analytics(self, request, pk=None):
+        homework = self.get_object()
+        return Response(grade_analytics('homework', homework.pk))
+
+    @extend_schema(request=HomeworkTestCaseSerializer, responses=HomeworkTestCaseSerializer(many=True))
+    @action(methods=['get', 'post'], detail=True, url_path='tests')
+    def tests(self, request, pk=None):
+        homework = self.get_object()
+        if request.method == 'POST':
+            serializer = HomeworkTestCaseSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(homework=homework)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(HomeworkTestCaseSerializer(homework.test_cases.all(), many=True).data)
+
+    @action(methods=['delete'], detail=True, url_path=r'tests/(?P<case_id>\d+)')
+    def delete_test(self, request, pk=None, case_id=None):
+        homework = self.get_object()
+        deleted, _ = homework.test_cases.filter(pk=case_id).delete()
+        if not deleted:
+            return Response({"error": "Test case not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=['post'], detail=True, url_path='run-tests')
+    def run_tests(self, request, pk=None):
+        # Results land in Grade.ai_correctness as the pool finishes; cached ones immediately
+        homework = self.get_object()
+        if not homework.test_cases.exists():
+            return Response({"error": "Homework has no test cases"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(run_homework_tests(homework), status=status.HTTP_202_ACCEPTED)
+        except SandboxUnavailable as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
 
 @extend_schema(tags=["teacher"])
 class TeacherGroupViewSet(viewsets.ModelViewSet):
@@ -221,50 +437,108 @@ class TeacherGroupViewSet(viewsets.ModelViewSet):
     http_method_names = ['get']
 
     def get_queryset(self):
-        return Group.objects.filter(teacher=self.request.user)
+        return Group.objects.filter(teacher=self.request.user, deleting_at__isnull=True).select_related(
+            'teacher', 'course')
 
     @action(methods=['get'], detail=True, url_path='submissions')
     def submissions(self, request, pk=None):
         group = self.get_object()
-        submissions = Submission.objects.filter(homework__group=group)
+        submissions = Submission.objects.filter(
+            homework__group=group, homework__deleting_at__isnull=True).select_related(
+            'homework', 'student', 'grade').prefetch_related('files__metrics')
         serializer = SubmissionSerializer(submissions, many=True)
         return Response(serializer.data)
 
     @action(methods=['get'], detail=True, url_path='leaderboard')
     def leaderboard(self, request, pk=None):
         group = self.get_object()
-        submissions = Submission.objects.filter(student__group=group, final_grade__isnull=False)
-        result = {}
-        for submission in submissions:
-            student = submission.student
-            if student.id not in result:
-                result[student.id] = {
-                    'student_id': student.id,
-                    'full_name': student.fullname,
-                    'total_grade': 0
-                }
-            result[student.id]['total_grade'] += submission.final_grade
-
-        sorted_list = sorted(result.values(), key=lambda x: x['total_grade'], reverse=True)
+        totals = student_totals(student__group=group)
+        students = User.objects.filter(id__in=totals).values_list('id', 'fullname')
+        result = [{'student_id': pk, 'full_name': fullname, 'total_grade': totals[pk]} for pk, fullname in students]
+
+        sorted_list = sorted(result, key=lambda x: x['total_grade'], reverse=True)
         return Response(sorted_list)
 
+    @action(methods=['get'], detail=True, url_path='analytics')
+    def analytics(self, request, pk=None):
+        group = self.get_object()
+        return Response(grade_analytics('group', group.pk))
+
+
+class ArchivedSubmissionMixin:
+    # Detail access to an archived submission restores it into the hot tables first
+
+    def get_archived_queryset(self):
+        return ArchivedSubmission.objects.none()
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404 as not_found:
+            try:
+                original_id = int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            except ValueError:
+                raise not_found
+            archived = self.get_archived_queryset().filter(original_id=original_id).first()
+            if archived is None:
+                raise
+            rehydrate(archived)
+            return super().get_object()
+
+
+class SubmissionHistoryMixin:
+
+    @action(methods=['get'], detail=True, url_path='versions')
+    def versions(self, request, pk=None):
+        submission = self.get_object()
+        return Response({"current": submission.version, "versions": history(submission)})
+
+    @action(methods=['get'], detail=True, url_path=r'versions/(?P<version>\d+)')
+    def version(self, request, pk=None, version=None):
+        submission = self.get_object()
+        version = int(version)
+        if not 1 <= version <= submission.version:
+            return Response({"error": "Version not found"}, status=status.HTTP_404_NOT_FOUND)
+        files = reconstruct(submission, version)
+        return Response({
+            "version": version,
+            "files": [{"file_name": name, "content": content} for name, content in sorted(files.items())],
+        })
+
+
+@extend_schema(tags=["teacher"])
+class TeacherCourseViewSet(CourseStatsMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = CourseSerializer
+    permission_classes = [IsAuthenticated, IsTeacher]
+
+    def get_queryset(self):
+        return Course.objects.filter(groups__teacher=self.request.user, groups__deleting_at__isnull=True).distinct()
+
 
 @extend_schema(tags=["teacher"])
-class TeacherSubmissionViewSet(viewsets.ModelViewSet):
+class TeacherSubmissionViewSet(SubmissionHistoryMixin, ArchivedSubmissionMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsTeacher]
     serializer_class = SubmissionSerializer
     http_method_names = ['get', 'put']
 
     def get_queryset(self):
-        return Submission.objects.filter(homework__teacher=self.request.user)
+        return Submission.objects.filter(homework__teacher=self.request.user,
+                                         homework__deleting_at__isnull=True).select_related(
+            'homework', 'student', 'grade').prefetch_related('files__metrics')
+
+    def get_archived_queryset(self):
+        return ArchivedSubmission.objects.filter(homework__teacher=self.request.user)
 
     @action(methods=['put'], detail=True, url_path='grade')
     def grade(self, request, pk=None):
-        submission = get_object_or_404(Submission, id=pk, homework__teacher=self.request.user)
+        submission = self.get_object()
         grade, created = Grade.objects.get_or_create(submission=submission)
         serializer = GradeSerializer(grade, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save(modified_by_teacher=True)
+        grade = serializer.save(modified_by_teacher=True)
+        if grade.teacher_total is not None and grade.teacher_total != submission.final_grade:
+            submission.final_grade = grade.teacher_total
+            submission.save(update_fields=['final_grade'])
         return Response(serializer.data)
 
 
@@ -275,19 +549,28 @@ class StudentHomeworkViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        if self.request.user.group:
-            return Homework.objects.filter(group=self.request.user.group)
+        if self.request.user.group_id:
+            return Homework.objects.filter(group_id=self.request.user.group_id, deleting_at__isnull=True)
         return Homework.objects.none()
 
 
 @extend_schema(tags=["student"])
-class StudentSubmissionViewSet(viewsets.ModelViewSet):
+class StudentSubmissionViewSet(SubmissionHistoryMixin, ArchivedSubmissionMixin, viewsets.ModelViewSet):
     serializer_class = SubmissionSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, IsStudent]
     http_method_names = ['get', 'post']
 
     def get_queryset(self):
-        return Submission.objects.filter(student=self.request.user)
+        return Submission.objects.filter(student=self.request.user, homework__deleting_at__isnull=True).select_related(
+            'homework', 'student', 'grade').prefetch_related('files__metrics')
+
+    def get_archived_queryset(self):
+        return ArchivedSubmission.objects.filter(student=self.request.user)
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [throttle() for throttle in SUBMISSION_THROTTLES]
+        return super().get_throttles()
 
     def perform_create(self, serializer):
         serializer.save(student=self.request.user)
@@ -0,0 +1,117 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+RETRIES = 3
+
+
+class WriteQueue:
+    """
+    Runs writes nobody is waiting for (code metrics, test results, session rows, last-login
+    touches) one after another in a single background thread per process. On SQLite this keeps
+    them from competing with request writes for the database lock.
+    """
+
+    def __init__(self, max_size=10000):
+        self.queue = queue.Queue(max_size)
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            # A forked worker inherits the object but not the thread
+            if self.thread is None or self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.run, name='write-queue', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def submit(self, func, *args, **kwargs):
+        self.start()
+        try:
+            self.queue.put_nowait((func, args, kwargs))
+        except queue.Full:
+            # Back-pressure: the caller pays for the write instead of growing the backlog
+            self._execute(func, args, kwargs)
+
+    def flush(self, timeout=10):
+        """Waits until everything submitted so far is written; False if timeout ran out first."""
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _execute(self, func, args, kwargs):
+        for attempt in range(RETRIES):
+            try:
+                with transaction.atomic():
+                    func(*args, **kwargs)
+                return
+            except OperationalError:
+                if attempt == RETRIES - 1:
+                    logger.exception('Queued write %s failed after %s attempts', func.__qualname__, RETRIES)
+                else:
+                    time.sleep(0.1 * 2 ** attempt)
+            except Exception:
+                logger.exception('Queued write %s failed', func.__qualname__)
+                return
+
+    def run(self):
+        while True:
+            func, args, kwargs = self.queue.get()
+            try:
+                self._execute(func, args, kwargs)
+            finally:
+                self.queue.task_done()
+            if self.queue.empty():
+                # The writer thread owns its connection; do not keep it open while idle
+                connection.close()
+
+
+def queue_result(store, *args):
+    """Done-callback for process pool futures: store(*args, future.result()) runs on the write queue."""
+    def callback(future):
+        # Runs in the executor's callback thread, so close its own connection
+        try:
+            get_write_queue().submit(store, *args, future.result())
+        except Exception:
+            logger.exception('Result for %s could not be stored', store.__qualname__)
+        finally:
+            connection.close()
+    return callback
+
+
+class InlineWrites:
+    # Used when WRITE_QUEUE_ENABLED is off: same interface, writes happen in the calling thread
+
+    def submit(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+    def flush(self, timeout=None):
+        return True
+
+
+_queue = None
+
+
+def get_write_queue():
+    global _queue
+    if _queue is None:
+        if getattr(settings, 'WRITE_QUEUE_ENABLED', False):
+            _queue = WriteQueue(max_size=getattr(settings, 'WRITE_QUEUE_SIZE', 10000))
+        else:
+            _queue = InlineWrites()
+    return _queue
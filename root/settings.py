@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -34,11 +35,14 @@ INSTALLED_APPS = [
     'drf_spectacular',
 
     #JWT
-    'rest_framework_simplejwt'
+    'rest_framework_simplejwt',
+
+    'django_filters',
 
 ]
 
 MIDDLEWARE = [
+    'apps.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,10 +77,20 @@ WSGI_APPLICATION = 'root.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# WAL lets reads run beside the single writer. IMMEDIATE transactions take the write lock up front,
+# so concurrent writers wait out busy_timeout instead of failing with "database is locked" when a
+# read lock cannot be upgraded. synchronous=NORMAL is durable in WAL mode except on power loss.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA busy_timeout=20000; PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; '
+                            'PRAGMA temp_store=MEMORY; PRAGMA cache_size=-20000',
+        },
+        # A file, not the in-memory default: the concurrency tests need connections from several processes
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -125,7 +139,7 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
@@ -140,8 +154,60 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Token buckets from apps.throttling: '<capacity>/<period>', refilled evenly over the period
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '300/min',
+        'login_ip': '20/min',
+        'login_username': '10/min',
+        'register': '100/min',
+        'register_ip': '5/min',
+        'submission': '600/min',
+        'submission_user': '10/min',
+    },
+}
+
+# Token versions (apps.tokens) and the grade analytics version live here, so every worker must
+# see the same cache: Redis when REDIS_URL is set, otherwise files shared by the workers on this host
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
+# Shared SQLite file holding the throttle buckets of every worker on the host; tests override it with ':memory:'
+THROTTLE_STORE_PATH = BASE_DIR / 'throttle.sqlite3'
+
+# Request profiling: Server-Timing on sampled requests, per-view histograms at /metrics,
+# and cProfile dumps of the CPROFILE_TOP_N slowest sampled requests when it is above zero
+PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.1,
+    'CPROFILE_TOP_N': 0,
+    'CPROFILE_DIR': BASE_DIR / 'profiles',
 }
 
+# Deletes cascading into at least this many submissions run in the background (process_deletions)
+DELETION_INLINE_LIMIT = 1000
+
+# Background writes (code metrics, test results, session rows) go through one writer thread per process
+WRITE_QUEUE_ENABLED = True
+WRITE_QUEUE_SIZE = 10000
+
+# Login sessions are written behind in batches of this size or at this interval (seconds). Buffered
+# rows are also published in the shared cache, so a session list served by any worker includes them.
+SESSION_BUFFER_SIZE = 100
+SESSION_BUFFER_INTERVAL = 2.0
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'PDP LeaderBoard API',
     'DESCRIPTION': 'Your project description',
@@ -150,6 +216,9 @@ SPECTACULAR_SETTINGS = {
     # OTHER SETTINGS
 }
 
+# Built by `manage.py build_schema`; without it the schema is generated live only when DEBUG is on
+SPECTACULAR_SCHEMA_PATH = BASE_DIR / 'static' / 'openapi.json.gz'
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=5),
@@ -183,8 +252,8 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "apps.serializer.ClaimsTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "apps.serializer.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -193,3 +262,16 @@ SIMPLE_JWT = {
 
 
 
+# Process pool size for code metrics at ingest (None = all cores)
+CODE_METRICS_WORKERS = None
+
+# Homework test cases run in this many spawned workers (None = all cores), each run under these rlimits
+SANDBOX = {
+    'WORKERS': None,
+    'LIMITS': {'CPU_SECONDS': 2, 'WALL_SECONDS': 5, 'MEMORY_MB': 256, 'OUTPUT_KB': 64},
+    # The project tree and database directories are hidden from student code, plus these
+    'HIDDEN_PATHS': [],
+    # Without unshare (most containers) only the Python audit hook blocks the network and the
+    # project files; off refuses to run
+    'ALLOW_AUDIT_HOOK_ONLY': False,
+}
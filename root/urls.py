@@ -16,22 +16,27 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView, TokenVerifyView
+from rest_framework_simplejwt.views import TokenVerifyView
+
+from apps.profiling import MetricsView
+from apps.schema import CachedSchemaAPIView, CachedSwaggerView, CachedRedocView
+from apps.views import LoginTokenObtainPairView, LoginTokenRefreshView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     #Auth
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/', LoginTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', LoginTokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
 
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('api/schema/', CachedSchemaAPIView.as_view(), name='schema'),
+    path('api/schema/<str:version>/', CachedSchemaAPIView.as_view(), name='schema-versioned'),
+    path('api/docs/', CachedSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('api/redoc/', CachedRedocView.as_view(url_name='schema'), name='redoc'),
     # Optional UI:
-    path('', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('', CachedSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api-auth/', include('rest_framework.urls')),
     path('api/', include('apps.urls')),
 ]